@@ -1,30 +1,139 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
-import joblib
-import numpy as np
-import requests
-import pandas as pd  # <--- ADD THIS IMPORT
+import threading
+import time
 from config import Config
+from spatial import StationIndex
+from model_loader import FAILED, ModelHandle
+from monitoring import ShadowScorer, SqliteScoreStore
+from history import ReadingHistory
+from replay import UpstreamClient
+from cache import SqliteFeed, create_result_cache, realtime_cache_key
+from ratelimit import AdmissionController, ClientRateLimiter, create_provider_budget
 import os
 
+# numpy, pandas, joblib and requests are imported inside the functions that
+# need them so that workers can start serving before those are loaded.
+
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app, origins=app.config['CORS_ORIGINS'])
 
+# Behind a reverse proxy every request comes from the proxy's address; take
+# the client address from X-Forwarded-For so rate limits stay per client
+if app.config['TRUSTED_PROXY_HOPS']:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_HOPS'])
+
+# All IQAir/OpenWeatherMap traffic goes through this client so it can be
+# recorded to, or replayed from, an on-disk archive
+upstream = UpstreamClient(
+    mode=app.config['UPSTREAM_MODE'],
+    archive_path=app.config['UPSTREAM_ARCHIVE'],
+    latency_scale=app.config['UPSTREAM_LATENCY_SCALE']
+)
+
 # ============================================
 # LOAD ML MODEL
 # ============================================
-try:
-    model = joblib.load(app.config['MODEL_PATH'])
-    scaler = joblib.load(app.config['SCALER_PATH'])
-    feature_names = joblib.load(app.config['FEATURES_PATH'])
-    print("✅ ML Model loaded successfully")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
-    model = None
-    scaler = None
-    feature_names = None
+# MODEL_LOADING: 'background' warms up in a thread, 'eager' loads before
+# serving, 'lazy' loads on the first request that needs the model.
+model_handle = ModelHandle(
+    app.config['MODEL_PATH'],
+    app.config['SCALER_PATH'],
+    app.config['FEATURES_PATH']
+)
+if app.config['MODEL_LOADING'] == 'eager':
+    model_handle.load()
+elif app.config['MODEL_LOADING'] == 'background':
+    model_handle.start_background()
+
+# Recent realtime results; stale entries back degraded mode
+realtime_cache = create_result_cache(
+    app.config['REALTIME_CACHE_BACKEND'],
+    path=app.config['REALTIME_CACHE_PATH'],
+    max_entries=app.config['REALTIME_CACHE_MAX_ENTRIES'],
+    max_age=app.config['REALTIME_STALE_MAX_AGE']
+)
+
+# Per-client rate limits and per-provider quota budgets
+admission = AdmissionController(
+    ClientRateLimiter(app.config['CLIENT_RATE_PER_MINUTE'], app.config['CLIENT_BURST']),
+    [
+        create_provider_budget(
+            app.config['PROVIDER_BUDGET_BACKEND'],
+            'iqair',
+            app.config['IQAIR_RATE_PER_MINUTE'],
+            app.config['IQAIR_QUOTA'],
+            app.config['IQAIR_QUOTA_WINDOW_HOURS'] * 3600,
+            app.config['QUOTA_RESERVE_FRACTION'],
+            path=app.config['REALTIME_CACHE_PATH']
+        ),
+        create_provider_budget(
+            app.config['PROVIDER_BUDGET_BACKEND'],
+            'openweathermap',
+            app.config['OPENWEATHER_RATE_PER_MINUTE'],
+            app.config['OPENWEATHER_QUOTA'],
+            app.config['OPENWEATHER_QUOTA_WINDOW_HOURS'] * 3600,
+            app.config['QUOTA_RESERVE_FRACTION'],
+            path=app.config['REALTIME_CACHE_PATH']
+        ),
+    ]
+)
+
+# Latest reading per station, used by the map endpoints
+station_index = StationIndex(
+    cell_size=app.config['MAP_CELL_SIZE_DEG'],
+    max_zoom=app.config['MAP_MAX_ZOOM'],
+    max_age=app.config['MAP_STATION_MAX_AGE']
+)
+
+# With the shared (sqlite) realtime cache, workers serve each other's fetches
+# from the cache, so station readings also go through a shared feed that
+# every worker replays into its own index before answering a map query
+station_feed = None
+if app.config['REALTIME_CACHE_BACKEND'] == 'sqlite':
+    station_feed = SqliteFeed(
+        app.config['REALTIME_CACHE_PATH'],
+        'station_feed',
+        max_age=app.config['MAP_STATION_MAX_AGE']
+    )
+_station_feed_id = 0
+_station_feed_lock = threading.Lock()
+
+def add_station(data):
+    """Record a successful realtime reading in the station index (shared between workers if configured)"""
+    if station_feed is None:
+        station_index.add(data)
+    else:
+        station_feed.append(data)
+        sync_station_index()
+
+def sync_station_index():
+    """Apply readings added to the shared feed since this worker last looked"""
+    global _station_feed_id
+    if station_feed is None:
+        return
+    with _station_feed_lock:
+        for row_id, stored_at, reading in station_feed.since(_station_feed_id):
+            station_index.add(reading, at=stored_at)
+            _station_feed_id = row_id
+
+_interpolator = None
+
+def get_interpolator():
+    """Create the IDW interpolator on first use (it pulls in numpy)"""
+    global _interpolator
+    if _interpolator is None:
+        from interpolation import IDWInterpolator
+        _interpolator = IDWInterpolator(
+            station_index,
+            power=app.config['INTERPOLATION_POWER'],
+            neighbours=app.config['INTERPOLATION_NEIGHBOURS'],
+            max_km=app.config['INTERPOLATION_MAX_KM']
+        )
+    return _interpolator
 
 # ============================================
 # HELPER FUNCTIONS
@@ -116,13 +225,84 @@ def calculate_pollutant_contribution(pollutants):
     
     return contributions
 
+def predict_batch(rows):
+    """Run the loaded model on a list of feature dicts and return the raw predictions"""
+    import pandas as pd
+    model = model_handle.model
+
+    # --- FIX FOR USERWARNING: Create a Pandas DataFrame with explicit feature names ---
+    # This ensures the input to the model matches the training data format and order
+    predict_df = pd.DataFrame(rows, columns=model_handle.feature_names)
+
+    if 'Linear' in str(type(model)): # Check if the model is LinearRegression
+        # For Linear Regression, input needs to be scaled
+        return model.predict(model_handle.scaler.transform(predict_df))
+    # For tree-based models like RandomForest, input does not need to be scaled
+    # and can be a DataFrame directly (recommended to avoid UserWarning)
+    return model.predict(predict_df)
+
+def training_reference():
+    """Per-feature mean/std seen in training, taken from the fitted StandardScaler"""
+    scaler = model_handle.scaler
+    if scaler is None or not hasattr(scaler, 'mean_'):
+        return None
+    return {
+        name: {'mean': float(mean), 'std': float(std)}
+        for name, mean, std in zip(model_handle.feature_names, scaler.mean_, scaler.scale_)
+    }
+
+# Compares the model with the AQI IQAir reports for the same pollutants.
+# With the shared (sqlite) realtime cache the scores are shared between workers too.
+shadow_scorer = ShadowScorer(
+    predict_batch,
+    lambda: model_handle.ready,
+    reference=training_reference,
+    window=app.config['MONITOR_WINDOW'],
+    batch_size=app.config['MONITOR_BATCH_SIZE'],
+    flush_interval=app.config['MONITOR_FLUSH_SECONDS'],
+    mae_alert=app.config['MONITOR_MAE_ALERT'],
+    drift_alert=app.config['MONITOR_DRIFT_ALERT'],
+    store=(SqliteScoreStore(app.config['REALTIME_CACHE_PATH'], window=app.config['MONITOR_WINDOW'])
+           if app.config['REALTIME_CACHE_BACKEND'] == 'sqlite' else None)
+)
+
+# Readings with a true AQI, kept for incremental retraining (ml_model/retrain_online.py)
+reading_history = ReadingHistory(app.config['HISTORY_PATH']) if app.config['HISTORY_ENABLED'] else None
+
+def record_reading(data):
+    """Store an IQAir reading (true AQI + pollutants) and queue it for shadow scoring"""
+    if data.get('source') != 'iqair':
+        return
+    pollutants = data.get('pollutants') or {}
+    if not any(pollutants.values()):
+        return  # Plans without pollutant concentrations give nothing to learn from
+    features = dict(pollutants)
+    defaults = {'Temperature': 25, 'Humidity': 60, 'Wind_Speed': 5, 'Pressure': 1013}
+    for name, default in defaults.items():
+        value = (data.get('weather') or {}).get(name)
+        features[name] = float(value) if value is not None else default
+
+    # Replayed responses are recordings, not new observations; keep them out of the training data
+    if reading_history is not None and not upstream.replaying:
+        try:
+            stored = reading_history.append(data['city'], data['source'], data.get('coordinates'),
+                                            features, data['aqi'], measured_at=data.get('measured_at'))
+        except Exception as e:
+            print(f"Failed to store reading: {e}")
+        else:
+            if not stored:
+                return  # Same IQAir measurement as an earlier fetch; already stored and scored
+    if app.config['MONITOR_ENABLED']:
+        shadow_scorer.submit(data['city'], features, data['aqi'])
+
 # ============================================
 # NEW: IQAIR & OPENWEATHERMAP API FUNCTIONS (Refactored)
 # ============================================
 
 def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
     """Fetch real-time AQI data from IQAir AirVisual API."""
-    api_key = app.config['IQAIR_API_KEY']
+    import requests
+    api_key = upstream.api_key(app.config['IQAIR_API_KEY'])
     if not api_key:
         return None # Return None if key is not set
 
@@ -131,7 +311,7 @@ def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
         if lat is not None and lon is not None:
             # Try nearest_city endpoint with lat/lon first
             url = f'http://api.airvisual.com/v2/nearest_city?lat={lat}&lon={lon}&key={api_key}'
-            response = requests.get(url)
+            response = upstream.get(url)
             response.raise_for_status()
             if response.json()['status'] == 'success':
                 data = response.json()
@@ -142,8 +322,14 @@ def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
         if data is None and city:
             # Fallback to city endpoint if nearest_city fails or no lat/lon
             # Note: IQAir city endpoint is less reliable without state/country
+            if lat is not None and lon is not None:
+                # fetch_realtime only paid for the nearest_city call; charge this one too
+                admitted, reserve = admission.plan([('iqair', 1)])
+                if not (admitted or reserve) or not admission.spend('iqair', 1, reserve=not admitted):
+                    print("IQAir budget exhausted; skipping city fallback")
+                    return None
             url = f'http://api.airvisual.com/v2/city?city={city}&state=&country=&key={api_key}'
-            response = requests.get(url)
+            response = upstream.get(url)
             response.raise_for_status()
             if response.json()['status'] == 'success':
                 data = response.json()
@@ -171,6 +357,15 @@ def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
             'O3': pollution.get('o3', 0),
         }
 
+        # Weather at the station, named like the model's training features
+        weather_data = aqi_data['current'].get('weather') or {}
+        weather = {
+            'Temperature': weather_data.get('tp'),  # °C
+            'Humidity': weather_data.get('hu'),     # %
+            'Wind_Speed': weather_data.get('ws'),   # m/s
+            'Pressure': weather_data.get('pr'),     # hPa
+        }
+
         # IQAir gives coordinates as [lon, lat], convert to [lat, lon]
         coordinates = {'lat': aqi_data['location']['coordinates'][1], 'lon': aqi_data['location']['coordinates'][0]}
 
@@ -191,6 +386,8 @@ def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
             'description': aqi_info['description'],
             'health_advice': aqi_info['health_advice'],
             'pollutants': pollutants,
+            'weather': weather,
+            'measured_at': pollution.get('ts'),  # when IQAir took the reading
             'timestamp': datetime.now().isoformat()
         }
 
@@ -203,7 +400,8 @@ def get_realtime_aqi_iqair(city=None, lat=None, lon=None):
 
 def get_realtime_aqi_openweathermap(city='London', lat=None, lon=None):
     """Fetch real-time AQI data from OpenWeatherMap API."""
-    api_key = app.config['OPENWEATHER_API_KEY']
+    import requests
+    api_key = upstream.api_key(app.config['OPENWEATHER_API_KEY'])
     
     if not api_key:
         print("OpenWeatherMap API key is missing.")
@@ -213,7 +411,7 @@ def get_realtime_aqi_openweathermap(city='London', lat=None, lon=None):
         # Resolve coordinates if not provided
         if lat is None or lon is None:
             geo_url = f'http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=1&appid={api_key}'
-            geo_response = requests.get(geo_url)
+            geo_response = upstream.get(geo_url)
             geo_data = geo_response.json()
             
             if not geo_data:
@@ -225,7 +423,7 @@ def get_realtime_aqi_openweathermap(city='London', lat=None, lon=None):
             city = geo_data[0]['name'] # Use the city name returned by geocoding
         
         url = f'http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}'
-        response = requests.get(url)
+        response = upstream.get(url)
         response.raise_for_status()
         data = response.json()
         
@@ -269,20 +467,107 @@ def get_realtime_aqi_openweathermap(city='London', lat=None, lon=None):
         print(f"Error parsing OpenWeatherMap data: {e}")
         return None
 
+def get_interpolated_aqi(lat, lon):
+    """Estimate AQI at a coordinate from stored station readings (no upstream calls)."""
+    sync_station_index()
+    estimate = get_interpolator().estimate(lat, lon)
+    if estimate is None:
+        return None
+
+    aqi = round(estimate['aqi'], 1)
+    aqi_info = get_aqi_info(aqi)
+    nearest = station_index.nearest(lat, lon, k=1)
+    # The estimate is only as fresh as the oldest reading that went into it
+    updated_at = estimate['updated_at']
+
+    return {
+        'success': True,
+        'source': 'interpolated',
+        'estimated': True,
+        'city': nearest[0]['city'] if nearest else None,
+        'coordinates': {'lat': lat, 'lon': lon},
+        'aqi': aqi,
+        'category': aqi_info['category'],
+        'color': aqi_info['color'],
+        'emoji': aqi_info['emoji'],
+        'description': aqi_info['description'],
+        'health_advice': aqi_info['health_advice'],
+        'pollutants': {k: round(v, 2) for k, v in estimate['pollutants'].items()},
+        'stations_used': estimate['stations_used'],
+        'nearest_station_km': round(estimate['nearest_km'], 2),
+        'data_age_seconds': round(max(0.0, time.time() - updated_at), 1),
+        'timestamp': datetime.fromtimestamp(updated_at).isoformat()
+    }
+
+REALTIME_PROVIDERS = {
+    'iqair': get_realtime_aqi_iqair,
+    'openweathermap': get_realtime_aqi_openweathermap,
+}
+
+def provider_configured(name):
+    """True if the provider has an API key (or we are replaying recordings)"""
+    key_name = 'IQAIR_API_KEY' if name == 'iqair' else 'OPENWEATHER_API_KEY'
+    return bool(upstream.api_key(app.config[key_name]))
+
+def check_client_rate_limit():
+    """Return a 429 response if the calling client is over its rate limit, else None"""
+    allowed, retry_after = admission.allow_client(request.remote_addr or 'unknown')
+    if allowed:
+        return None
+    response = jsonify({
+        'success': False,
+        'error': 'Too many requests. Please slow down.'
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
 # ============================================
 # API ENDPOINTS
 # ============================================
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    # ... (This function remains unchanged)
+    """Liveness check: the process is up and serving (the model may still be loading)"""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None,
+        'model_loaded': model_handle.ready,
+        'model': model_handle.snapshot(),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness check: 200 once the model is loaded, 503 until then"""
+    ready = model_handle.ready
+    if app.config['MODEL_LOADING'] == 'lazy':
+        # A lazy worker only loads on its first /api/predict, so it has to
+        # take traffic before then; it is only unready if loading failed
+        ready = model_handle.status != FAILED
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'model': model_handle.snapshot(),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Rate limiter, quota and degradation counters"""
+    return jsonify(dict(
+        admission.snapshot(),
+        realtime_cache_entries=len(realtime_cache),
+        timestamp=datetime.now().isoformat()
+    ))
+
+@app.route('/api/monitoring', methods=['GET'])
+def get_monitoring():
+    """Shadow-scoring error statistics and feature drift per location"""
+    location = request.args.get('location')
+    return jsonify(dict(
+        shadow_scorer.snapshot(location),
+        timestamp=datetime.now().isoformat()
+    ))
+
 @app.route('/api/predict', methods=['POST'])
 def predict_aqi():
     """Predict AQI based on pollutant values"""
@@ -309,22 +594,13 @@ def predict_aqi():
             'Pressure': float(data.get('Pressure', 1013))
         }
         
-        # --- FIX FOR USERWARNING: Create a Pandas DataFrame with explicit feature names ---
-        # This ensures the input to the model matches the training data format and order
-        if feature_names is None:
-            return jsonify({'error': 'ML model features not loaded.'}), 500
-
-        predict_df = pd.DataFrame([input_data], columns=feature_names)
-
-        # Make prediction
-        if 'Linear' in str(type(model)): # Check if the model is LinearRegression
-            # For Linear Regression, input needs to be scaled
-            features_scaled = scaler.transform(predict_df) # Pass DataFrame to scaler
-            prediction = model.predict(features_scaled)[0]
-        else:
-            # For tree-based models like RandomForest, input does not need to be scaled
-            # and can be a DataFrame directly (recommended to avoid UserWarning)
-            prediction = model.predict(predict_df)[0]
+        # Waits for an in-flight warm-up, or loads now in lazy mode
+        if not model_handle.ensure_loaded(timeout=app.config['MODEL_WAIT_TIMEOUT']):
+            if model_handle.status == FAILED:
+                return jsonify({'error': 'ML model features not loaded.'}), 500
+            return jsonify({'error': 'ML model is still loading. Try again shortly.'}), 503
+
+        prediction = predict_batch([input_data])[0]
         
         prediction = max(0, min(500, prediction))  # Clamp between 0-500
         
@@ -358,37 +634,120 @@ def predict_aqi():
 def get_realtime_aqi():
     """
     Fetch real-time AQI data.
-    Prioritizes IQAir, falls back to OpenWeatherMap.
+    Prioritizes IQAir, falls back to OpenWeatherMap, then to an estimate
+    interpolated from stored station readings when lat/lon are given.
+    Pass mode=interpolate to skip the upstream APIs entirely.
+    Fresh cached results are served without an upstream call, and stale
+    ones are used when provider quotas are nearly exhausted.
     """
+    limited = check_client_rate_limit()
+    if limited:
+        return limited
+
     try:
         lat = request.args.get('lat', type=float)
         lon = request.args.get('lon', type=float)
         city = request.args.get('city', 'London')
+        has_point = lat is not None and lon is not None
+
+        if request.args.get('mode') == 'interpolate':
+            if not has_point:
+                return jsonify({'error': 'lat and lon are required for mode=interpolate'}), 400
+            estimate = get_interpolated_aqi(lat, lon)
+            if estimate:
+                return jsonify(estimate)
+            return jsonify({
+                'success': False,
+                'error': 'No stored station readings close enough to interpolate.'
+            }), 404
         
-        # --- Try IQAir first ---
-        iqair_data = get_realtime_aqi_iqair(city=city, lat=lat, lon=lon)
-        if iqair_data and iqair_data.get('success'):
-            return jsonify(iqair_data)
-            
-        # --- FALLBACK: If IQAir fails or key not set, use OpenWeatherMap ---
-        print("Falling back to OpenWeatherMap...")
-        openweathermap_data = get_realtime_aqi_openweathermap(city=city, lat=lat, lon=lon)
-        if openweathermap_data and openweathermap_data.get('success'):
-            return jsonify(openweathermap_data)
-        
-        # If both fail, return an error
-        return jsonify({
-            'success': False,
-            'error': 'Failed to fetch real-time AQI data from both IQAir and OpenWeatherMap APIs. Check API keys and network connection.'
-        }), 500
+        cache_key = realtime_cache_key(city, lat, lon)
+        cached, cache_age = realtime_cache.get(cache_key)
+        if cached is not None and cache_age <= app.config['REALTIME_CACHE_TTL']:
+            admission.count('served_fresh_cache')
+            return jsonify(dict(cached, cache_age_seconds=round(cache_age, 1)))
+
+        # Single flight: if another thread/worker is already fetching this
+        # location, wait briefly for its result instead of fetching it again
+        claimed = realtime_cache.claim(cache_key, lease_seconds=app.config['REALTIME_FETCH_WAIT'] * 2)
+        if not claimed:
+            deadline = time.monotonic() + app.config['REALTIME_FETCH_WAIT']
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                fresh, fresh_age = realtime_cache.get(cache_key)
+                if fresh is not None and fresh_age <= app.config['REALTIME_CACHE_TTL']:
+                    admission.count('served_fresh_cache')
+                    return jsonify(dict(fresh, cache_age_seconds=round(fresh_age, 1)))
+        try:
+            return fetch_realtime(city, lat, lon, has_point, cache_key, cached, cache_age)
+        finally:
+            if claimed:
+                realtime_cache.release(cache_key)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def fetch_realtime(city, lat, lon, has_point, cache_key, cached, cache_age):
+    """Call the upstream providers within budget, degrading to cached or interpolated data"""
+    # --- Decide which providers we can afford to call ---
+    # IQAir first, then OpenWeatherMap; OWM needs an extra geocoding call without lat/lon.
+    # IQAir's city fallback after a failed nearest_city lookup is charged where it is made.
+    costs = [('iqair', 1), ('openweathermap', 1 if has_point else 2)]
+    costs = [(name, cost) for name, cost in costs if provider_configured(name)]
+    admitted, reserve = admission.plan(costs)
+
+    if admitted and admitted[0][0] != costs[0][0]:
+        admission.count('rerouted')
+
+    def try_providers(candidates, from_reserve):
+        for name, cost in candidates:
+            if not admission.spend(name, cost, reserve=from_reserve):
+                continue
+            data = REALTIME_PROVIDERS[name](city=city, lat=lat, lon=lon)
+            if data and data.get('success'):
+                realtime_cache.set(cache_key, data)
+                add_station(data)
+                record_reading(data)
+                return data
+            print(f"{name} lookup failed, trying next provider...")
+        return None
+
+    data = try_providers(admitted, False)
+    if data:
+        return jsonify(data)
+
+    # Quota nearly gone: prefer stale data over spending the reserve
+    if cached is not None:
+        admission.count('served_stale')
+        return jsonify(dict(cached, stale=True, cache_age_seconds=round(cache_age, 1)))
+
+    data = try_providers(reserve, True)
+    if data:
+        return jsonify(data)
+
+    if has_point:
+        estimate = get_interpolated_aqi(lat, lon)
+        if estimate:
+            return jsonify(estimate)
+
+    if costs and not admitted and not reserve:
+        admission.count('unavailable')
+        return jsonify({
+            'success': False,
+            'error': 'Upstream AQI providers are over their rate limit or quota. Try again later.'
+        }), 503
+
+    # If both fail, return an error
+    return jsonify({
+        'success': False,
+        'error': 'Failed to fetch real-time AQI data from both IQAir and OpenWeatherMap APIs. Check API keys and network connection.'
+    }), 500
+
 @app.route('/api/forecast', methods=['GET'])
 def get_forecast():
     """Generate AQI forecast for next 24 hours (simulated)"""
     # ... (This function remains unchanged)
+    import numpy as np
     try:
         city = request.args.get('city', 'London')
         current_aqi = request.args.get('current_aqi', 75, type=float)
@@ -428,6 +787,7 @@ def get_forecast():
 def get_historical():
     """Generate historical AQI data (simulated)"""
     # ... (This function remains unchanged)
+    import numpy as np
     try:
         days = request.args.get('days', 7, type=int)
         
@@ -506,16 +866,140 @@ def get_cities():
     })
 @app.route('/api/search_city', methods=['GET'])
 def search_city():
+    limited = check_client_rate_limit()
+    if limited:
+        return limited
+
     city = request.args.get('city')
-    api_key = app.config['OPENWEATHER_API_KEY']
+    api_key = upstream.api_key(app.config['OPENWEATHER_API_KEY'])
     if not city or not api_key:
         return jsonify([])
 
+    # Suggestions are a nicety: never spend reserved OpenWeatherMap quota on them
+    admitted, _ = admission.plan([('openweathermap', 1)])
+    if not admitted or not admission.spend('openweathermap', 1):
+        admission.count('unavailable')
+        return jsonify([]), 429
+
+    import requests
     url = f'http://api.openweathermap.org/geo/1.0/direct?q={city}&limit=5&appid={api_key}'
-    resp = requests.get(url)
+    try:
+        resp = upstream.get(url)
+    except requests.exceptions.RequestException as e:
+        print(f"City search failed for {city}: {e}")
+        return jsonify([])
     if resp.status_code != 200:
         return jsonify([])
     return jsonify(resp.json())
+
+# ============================================
+# MAP ENDPOINTS (served from the station index, no upstream calls)
+# ============================================
+
+def _viewport_args():
+    """Read a south/west/north/east viewport from the query string"""
+    bounds = {}
+    for name in ('south', 'west', 'north', 'east'):
+        value = request.args.get(name, type=float)
+        if value is None:
+            raise ValueError(f'Missing or invalid parameter: {name}')
+        bounds[name] = value
+    if bounds['south'] > bounds['north']:
+        raise ValueError('south must not be greater than north')
+    return bounds
+
+@app.route('/api/map/tiles', methods=['GET'])
+def get_map_tiles():
+    """Aggregated AQI per map tile for a viewport and zoom level"""
+    try:
+        bounds = _viewport_args()
+        zoom = request.args.get('zoom', 3, type=int)
+        sync_station_index()
+        tiles = station_index.tiles(zoom=zoom, **bounds)
+        for tile in tiles:
+            aqi_info = get_aqi_info(tile['aqi'])
+            tile['category'] = aqi_info['category']
+            tile['color'] = aqi_info['color']
+
+        return jsonify({
+            'success': True,
+            'zoom': max(0, min(zoom, station_index.max_zoom)),
+            'tiles': tiles,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/map/heatmap', methods=['GET'])
+def get_map_heatmap():
+    """Interpolated AQI on a regular grid covering a viewport"""
+    try:
+        bounds = _viewport_args()
+        rows = request.args.get('rows', 50, type=int)
+        cols = request.args.get('cols', 50, type=int)
+        if rows < 2 or cols < 2:
+            return jsonify({'error': 'rows and cols must be at least 2'}), 400
+        if rows * cols > app.config['HEATMAP_MAX_CELLS']:
+            return jsonify({'error': f"Grid too large (max {app.config['HEATMAP_MAX_CELLS']} cells)"}), 400
+
+        import numpy as np
+        sync_station_index()
+        lats, lons, grid = get_interpolator().grid(rows=rows, cols=cols, **bounds)
+        values = [
+            [None if np.isnan(v) else round(float(v), 1) for v in row]
+            for row in grid
+        ]
+
+        return jsonify({
+            'success': True,
+            'lats': [round(float(v), 5) for v in lats],
+            'lons': [round(float(v), 5) for v in lons],
+            'aqi': values,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/map/stations', methods=['GET'])
+def get_map_stations():
+    """Stored station readings inside a viewport"""
+    try:
+        bounds = _viewport_args()
+        sync_station_index()
+        return jsonify({
+            'success': True,
+            'stations': station_index.within_bbox(**bounds),
+            'timestamp': datetime.now().isoformat()
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/map/nearest', methods=['GET'])
+def get_nearest_stations():
+    """Nearest stored stations to a coordinate"""
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        if lat is None or lon is None:
+            return jsonify({'error': 'lat and lon are required'}), 400
+        k = max(1, min(request.args.get('k', 5, type=int), 50))
+        max_km = request.args.get('max_km', type=float)
+
+        sync_station_index()
+        return jsonify({
+            'success': True,
+            'stations': station_index.nearest(lat, lon, k=k, max_km=max_km),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============================================
 # RUN APP
 # ============================================
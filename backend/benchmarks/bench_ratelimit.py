@@ -0,0 +1,63 @@
+"""
+Micro-benchmark of the rate limiter's per-request overhead.
+
+    python benchmarks/bench_ratelimit.py --iterations 200000 --clients 1000
+    python benchmarks/bench_ratelimit.py --iterations 5000 --backend sqlite
+
+Measures the client bucket check and a provider admission decision, the
+two limiter operations on the /api/realtime hot path. `--backend sqlite`
+measures the provider budgets shared between gunicorn workers.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import AdmissionController, ClientRateLimiter, create_provider_budget  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate limiter overhead benchmark')
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--clients', type=int, default=1000, help='Distinct client ids to cycle through')
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory',
+                        help='Provider budget backend')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'budgets.sqlite3')
+    admission = AdmissionController(
+        ClientRateLimiter(rate_per_minute=1e9, burst=1e9),
+        [create_provider_budget(args.backend, name, 1e9, 10 ** 12, 3600, path=path)
+         for name in ('iqair', 'openweathermap')]
+    )
+    clients = [f'10.0.{i // 256}.{i % 256}' for i in range(args.clients)]
+    costs = [('iqair', 1), ('openweathermap', 2)]
+
+    started = time.perf_counter()
+    for i in range(args.iterations):
+        admission.allow_client(clients[i % len(clients)])
+    client_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        admission.plan(costs)
+    plan_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        admission.spend('iqair', 1)
+    spend_us = (time.perf_counter() - started) / args.iterations * 1e6
+
+    print(f"\n⏱️ Rate limiter overhead ({args.iterations} iterations, {args.clients} clients, "
+          f"{args.backend} budgets)")
+    print(f"  Client bucket check:        {client_us:.2f} µs")
+    print(f"  Provider admission (2 prv): {plan_us:.2f} µs")
+    print(f"  Provider spend:             {spend_us:.2f} µs")
+    print(f"  Total per realtime request: {client_us + plan_us + spend_us:.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
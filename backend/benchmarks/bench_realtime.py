@@ -0,0 +1,94 @@
+"""
+Benchmark /api/realtime deterministically from a recorded upstream archive.
+
+Record an archive first by running the backend with UPSTREAM_MODE=record
+and exercising the realtime endpoint, then:
+
+    python benchmarks/bench_realtime.py --archive recordings/upstream.jsonl.gz \
+        --requests 500 --concurrency 8 --latency-scale 1.0 --city London --city Delhi
+
+No network access or API keys are needed in replay mode.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay-mode benchmark for /api/realtime')
+    parser.add_argument('--archive', required=True, help='Recorded upstream archive (.jsonl.gz)')
+    parser.add_argument('--requests', type=int, default=200, help='Total requests to send')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client threads')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='Multiplier applied to recorded upstream latency (0 = no delay)')
+    parser.add_argument('--city', action='append', default=[], help='City query (repeatable)')
+    parser.add_argument('--point', action='append', default=[], help='lat,lon query (repeatable)')
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def main():
+    args = parse_args()
+
+    # Configure replay mode before the app (and its Config) is imported
+    os.environ['UPSTREAM_MODE'] = 'replay'
+    os.environ['UPSTREAM_ARCHIVE'] = os.path.abspath(args.archive)
+    os.environ['UPSTREAM_LATENCY_SCALE'] = str(args.latency_scale)
+    # Every request comes from the one test client and must reach the
+    # (replayed) upstream, so lift the client and provider limits and
+    # disable result caching and single-flight waiting
+    for name in ('CLIENT_RATE_PER_MINUTE', 'CLIENT_BURST', 'IQAIR_RATE_PER_MINUTE', 'IQAIR_QUOTA',
+                 'OPENWEATHER_RATE_PER_MINUTE', 'OPENWEATHER_QUOTA'):
+        os.environ[name] = str(10 ** 9)
+    os.environ['REALTIME_CACHE_TTL'] = '0'
+    os.environ['REALTIME_FETCH_WAIT'] = '0'
+    # Keep replayed readings out of the retraining database and the monitoring stats
+    os.environ['HISTORY_ENABLED'] = 'False'
+    os.environ['MONITOR_ENABLED'] = 'False'
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    from app import app
+
+    queries = [f'/api/realtime?city={city}' for city in args.city]
+    for point in args.point:
+        lat, lon = point.split(',')
+        queries.append(f'/api/realtime?lat={lat.strip()}&lon={lon.strip()}')
+    if not queries:
+        queries = ['/api/realtime?city=London']
+
+    def run(i):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.get(queries[i % len(queries)])
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(run, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    latencies = [r[0] * 1000 for r in results]
+    errors = sum(1 for r in results if r[1] != 200)
+
+    print(f"\n📊 /api/realtime replay benchmark ({args.requests} requests, "
+          f"concurrency {args.concurrency}, latency scale {args.latency_scale})")
+    print(f"  Throughput: {args.requests / wall:.1f} req/s")
+    print(f"  Mean:       {statistics.mean(latencies):.2f} ms")
+    print(f"  p50:        {percentile(latencies, 50):.2f} ms")
+    print(f"  p95:        {percentile(latencies, 95):.2f} ms")
+    print(f"  p99:        {percentile(latencies, 99):.2f} ms")
+    print(f"  Errors:     {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Throughput scaling of the production (gunicorn, preforked) server from 1 to N workers.
+
+    python benchmarks/bench_scaling.py --model-dir ../ml_model --max-workers 8 --duration 10
+
+For each worker count this starts `gunicorn -c gunicorn.conf.py wsgi:application`,
+waits for /api/ready, drives POST /api/predict from separate client
+processes, and reports throughput, latency and memory. Linux only: memory
+comes from /proc/<pid>/smaps_rollup. PSS (proportional set size) much
+lower than RSS across workers means the preloaded model pages are shared.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAYLOAD = json.dumps({
+    'PM2.5': 35.5, 'PM10': 50.0, 'NO2': 20.0, 'SO2': 5.0, 'CO': 0.5, 'O3': 30.0,
+    'Temperature': 25.0, 'Humidity': 60.0, 'Wind_Speed': 5.0, 'Pressure': 1013.0
+})
+
+
+def client_loop(args):
+    """Send predict requests over one keep-alive connection until the deadline"""
+    port, deadline = args
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            conn.request('POST', '/api/predict', PAYLOAD, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def wait_ready(port, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/ready')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def child_pids(pid):
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as fh:
+            pids.extend(int(p) for p in fh.read().split())
+    return pids
+
+
+def memory_kb(pids):
+    totals = {'Rss': 0, 'Pss': 0}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as fh:
+                for line in fh:
+                    key = line.split(':')[0]
+                    if key in totals:
+                        totals[key] += int(line.split()[1])
+        except OSError:
+            pass
+    return totals
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * (len(ordered) - 1)))]
+
+
+def run(workers, args, port):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(args.threads),
+        BIND=f'127.0.0.1:{port}',
+        CLIENT_RATE_PER_MINUTE='1e9',
+        CLIENT_BURST='1e9',
+    )
+    if args.model_dir:
+        env['MODEL_DIR'] = os.path.abspath(args.model_dir)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_ready(port):
+            raise RuntimeError(f'Server with {workers} workers never became ready')
+        # Short warm-up so every worker has served at least once
+        clients = args.clients_per_worker * workers
+        with multiprocessing.Pool(clients) as pool:
+            pool.map(client_loop, [(port, time.time() + 1.0)] * clients)
+            deadline = time.time() + args.duration
+            results = pool.map(client_loop, [(port, deadline)] * clients)
+
+        latencies = [lat for r in results for lat in r[0]]
+        errors = sum(r[1] for r in results)
+        mem = memory_kb(child_pids(server.pid))
+        return {
+            'workers': workers,
+            'rps': len(latencies) / args.duration,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else float('nan'),
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else float('nan'),
+            'errors': errors,
+            'rss_mb': mem['Rss'] / 1024,
+            'pss_mb': mem['Pss'] / 1024,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gunicorn throughput scaling benchmark')
+    parser.add_argument('--model-dir', help='Directory holding the model artifacts')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per step')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per worker (predict is CPU bound)')
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    steps = sorted({1, *[w for w in (2, 4, 8, 16, 32, 64) if w < args.max_workers], args.max_workers})
+    print(f"\n📈 /api/predict throughput vs workers ({os.cpu_count()} CPU cores, "
+          f"{args.duration:.0f}s per step, {args.clients_per_worker} clients per worker)\n")
+    print(f"  {'workers':>7}{'req/s':>10}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'RSS MB':>9}{'PSS MB':>9}")
+    base = None
+    for workers in steps:
+        r = run(workers, args, args.port)
+        base = base or r['rps']
+        print(f"  {r['workers']:>7}{r['rps']:>10.1f}{r['rps'] / base:>9.2f}{r['p50_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['errors']:>8}{r['rss_mb']:>9.1f}{r['pss_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Import-time and startup profile for the backend.
+
+    python benchmarks/import_profile.py [--top 15] [--model-dir PATH]
+
+For each MODEL_LOADING mode this starts a fresh interpreter and reports:
+- how long `import app` takes
+- time until /api/health answers (liveness)
+- time until /api/ready answers 200 (model loaded)
+
+It then prints the slowest imports from `python -X importtime -c "import app"`
+in the default (background) mode. Results from a reference run are kept in
+benchmarks/results/import_profile.txt.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import app as backend
+imported = time.perf_counter() - started
+client = backend.app.test_client()
+client.get('/api/health')
+live = time.perf_counter() - started
+heavy = sorted(m for m in ('numpy', 'pandas', 'joblib', 'sklearn', 'requests') if m in sys.modules)
+ready = None
+while time.perf_counter() - started < 60:
+    if client.get('/api/ready').status_code == 200:
+        ready = time.perf_counter() - started
+        break
+    if backend.model_handle.status == 'failed':
+        break
+    if backend.model_handle.status == 'pending':
+        backend.model_handle.ensure_loaded()
+        continue
+    time.sleep(0.01)
+print('PROBE ' + json.dumps({{'import': imported, 'live': live, 'ready': ready, 'heavy_at_live': heavy}}))
+'''
+
+
+def run_probe(mode, env):
+    env = dict(env, MODEL_LOADING=mode)
+    # Run from another directory to prove paths no longer depend on the CWD
+    out = subprocess.run(
+        [sys.executable, '-c', STARTUP_PROBE.format(backend=BACKEND_DIR)],
+        env=env, cwd=os.path.expanduser('~'), capture_output=True, text=True, check=True
+    )
+    line = next(l for l in out.stdout.splitlines() if l.startswith('PROBE '))
+    return json.loads(line[len('PROBE '):])
+
+
+def import_profile(env, top):
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        env=dict(env, MODEL_LOADING='background'), cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend import/startup profile')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to show')
+    parser.add_argument('--model-dir', help='Directory holding aqi_model.pkl, scaler.pkl, feature_names.pkl')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.model_dir:
+        env['MODEL_DIR'] = os.path.abspath(args.model_dir)
+
+    print("🚀 Backend startup (fresh interpreter per mode, seconds)\n")
+    print(f"  {'mode':<12}{'import app':>12}{'live':>10}{'ready':>10}   heavy modules loaded at live")
+    for mode in ('background', 'lazy', 'eager'):
+        r = run_probe(mode, env)
+        ready = f"{r['ready']:.3f}" if r['ready'] is not None else 'n/a'
+        heavy = ', '.join(r['heavy_at_live']) or '-'
+        print(f"  {mode:<12}{r['import']:>12.3f}{r['live']:>10.3f}{ready:>10}   {heavy}")
+
+    slowest = import_profile(env, args.top)
+    print(f"\n🐢 Slowest imports for `import app` (cumulative µs, MODEL_LOADING=background)\n")
+    for cumulative, self_us, name in slowest:
+        print(f"  {cumulative:>9}  {name}")
+
+
+if __name__ == '__main__':
+    main()
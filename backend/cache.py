@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def realtime_cache_key(city=None, lat=None, lon=None):
+    """Cache key for a realtime lookup; coordinates are rounded to ~1 km"""
+    if lat is not None and lon is not None:
+        return f"pt:{round(lat, 2)},{round(lon, 2)}"
+    return f"city:{(city or '').strip().lower()}"
+
+
+class ResultCache:
+    """
+    Small in-process LRU cache for upstream results.
+
+    Entries are kept past their freshness TTL so they can still be served
+    as stale data when the upstream quota is nearly exhausted.
+    """
+
+    def __init__(self, max_entries=1000, max_age=6 * 3600):
+        self.max_entries = int(max_entries)
+        self.max_age = float(max_age)
+        self._entries = OrderedDict()
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, age_seconds), or (None, None) if missing or too old"""
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None, None
+            stored_at, value = item
+            age = now - stored_at
+            if age > self.max_age:
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return value, age
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def claim(self, key, lease_seconds=10.0):
+        """Claim the right to fetch `key`; False if another caller holds a live lease"""
+        now = time.time()
+        with self._lock:
+            expires = self._leases.get(key)
+            if expires is not None and expires > now:
+                return False
+            self._leases[key] = now + lease_seconds
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._leases.pop(key, None)
+
+
+class SqliteResultCache:
+    """
+    ResultCache backed by a local SQLite file, shared by every worker process
+    on the host so N workers don't each fetch the same city.
+
+    Same interface as ResultCache. Each thread gets its own connection and
+    the database runs in WAL mode so readers never block the writer.
+    """
+
+    def __init__(self, path, max_entries=1000, max_age=6 * 3600):
+        self.path = path
+        self.max_entries = int(max_entries)
+        self.max_age = float(max_age)
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are keyed by pid as well as thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT stored_at, value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, None
+        age = time.time() - row[0]
+        if age > self.max_age:
+            return None, None
+        return json.loads(row[1]), age
+
+    def set(self, key, value):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO results (key, stored_at, value) VALUES (?, ?, ?)',
+            (key, time.time(), json.dumps(value, separators=(',', ':')))
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict(conn)
+
+    def _evict(self, conn):
+        conn.execute('DELETE FROM results WHERE stored_at < ?', (time.time() - self.max_age,))
+        conn.execute(
+            'DELETE FROM results WHERE key IN ('
+            'SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def claim(self, key, lease_seconds=10.0):
+        now = time.time()
+        conn = self._conn()
+        conn.execute('DELETE FROM leases WHERE key = ? AND expires_at <= ?', (key, now))
+        # INSERT OR IGNORE is atomic, so exactly one process wins the lease
+        cur = conn.execute(
+            'INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)',
+            (key, now + lease_seconds)
+        )
+        return cur.rowcount == 1
+
+    def release(self, key):
+        self._conn().execute('DELETE FROM leases WHERE key = ?', (key,))
+
+
+class SqliteFeed:
+    """
+    Append-only log of JSON values in a SQLite file shared by every worker
+    process on the host.
+
+    Each reader keeps the id of the last row it has applied and pulls only
+    newer rows with since(), an indexed range scan. Rows older than
+    max_age are pruned as new ones are appended.
+    """
+
+    def __init__(self, path, table, max_age=6 * 3600):
+        self.path = path
+        self.table = table
+        self.max_age = float(max_age)
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, stored_at REAL NOT NULL, value TEXT NOT NULL)'
+        )
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are keyed by pid as well as thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, value):
+        conn = self._conn()
+        conn.execute(
+            f'INSERT INTO {self.table} (stored_at, value) VALUES (?, ?)',
+            (time.time(), json.dumps(value, separators=(',', ':')))
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute(f'DELETE FROM {self.table} WHERE stored_at < ?', (time.time() - self.max_age,))
+
+    def since(self, last_id=0):
+        """Rows with id > last_id and younger than max_age, as (id, stored_at, value) in id order"""
+        rows = self._conn().execute(
+            f'SELECT id, stored_at, value FROM {self.table} WHERE id > ? AND stored_at >= ? ORDER BY id',
+            (last_id, time.time() - self.max_age)
+        ).fetchall()
+        return [(row_id, stored_at, json.loads(value)) for row_id, stored_at, value in rows]
+
+
+def create_result_cache(backend, path=None, max_entries=1000, max_age=6 * 3600):
+    """Build the realtime cache for the configured backend ('memory' or 'sqlite')"""
+    if backend == 'sqlite':
+        return SqliteResultCache(path, max_entries=max_entries, max_age=max_age)
+    if backend == 'memory':
+        return ResultCache(max_entries=max_entries, max_age=max_age)
+    raise ValueError(f'Unknown cache backend: {backend}')
@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Paths below resolve relative to this package, not the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     # Flask
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
@@ -12,10 +15,72 @@ class Config:
     OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '')
     IQAIR_API_KEY = os.getenv('IQAIR_API_KEY', '')
     
+    # Upstream record/replay: 'live', 'record' or 'replay'
+    UPSTREAM_MODE = os.getenv('UPSTREAM_MODE', 'live')
+    UPSTREAM_ARCHIVE = os.getenv('UPSTREAM_ARCHIVE', os.path.join(BASE_DIR, 'recordings', 'upstream.jsonl.gz'))
+    UPSTREAM_LATENCY_SCALE = float(os.getenv('UPSTREAM_LATENCY_SCALE', '1.0'))
+    
+    # Realtime result cache (fresh hits skip upstream; stale entries back degraded mode)
+    REALTIME_CACHE_TTL = int(os.getenv('REALTIME_CACHE_TTL', '300'))
+    REALTIME_STALE_MAX_AGE = int(os.getenv('REALTIME_STALE_MAX_AGE', str(6 * 3600)))
+    REALTIME_CACHE_MAX_ENTRIES = int(os.getenv('REALTIME_CACHE_MAX_ENTRIES', '5000'))
+    # 'memory' (per process) or 'sqlite' (shared by all workers on the host)
+    REALTIME_CACHE_BACKEND = os.getenv('REALTIME_CACHE_BACKEND', 'memory')
+    REALTIME_CACHE_PATH = os.getenv('REALTIME_CACHE_PATH', os.path.join(BASE_DIR, 'data', 'realtime_cache.sqlite3'))
+    # How long a request waits for another worker already fetching the same location
+    REALTIME_FETCH_WAIT = float(os.getenv('REALTIME_FETCH_WAIT', '3'))
+    
+    # Rate limiting: per client, and per upstream provider (per-minute limit + quota window)
+    CLIENT_RATE_PER_MINUTE = float(os.getenv('CLIENT_RATE_PER_MINUTE', '60'))
+    CLIENT_BURST = float(os.getenv('CLIENT_BURST', '20'))
+    # Reverse proxies in front of the app that set X-Forwarded-For; clients are
+    # keyed on the address they report. Leave at 0 when serving directly, or
+    # clients could spoof the header to dodge their limit.
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+    IQAIR_RATE_PER_MINUTE = float(os.getenv('IQAIR_RATE_PER_MINUTE', '5'))
+    IQAIR_QUOTA = int(os.getenv('IQAIR_QUOTA', '10000'))
+    IQAIR_QUOTA_WINDOW_HOURS = float(os.getenv('IQAIR_QUOTA_WINDOW_HOURS', str(30 * 24)))
+    OPENWEATHER_RATE_PER_MINUTE = float(os.getenv('OPENWEATHER_RATE_PER_MINUTE', '60'))
+    OPENWEATHER_QUOTA = int(os.getenv('OPENWEATHER_QUOTA', '1000'))
+    OPENWEATHER_QUOTA_WINDOW_HOURS = float(os.getenv('OPENWEATHER_QUOTA_WINDOW_HOURS', '24'))
+    QUOTA_RESERVE_FRACTION = float(os.getenv('QUOTA_RESERVE_FRACTION', '0.1'))
+    # 'memory' (per process) or 'sqlite' (one budget shared by all workers, kept in
+    # REALTIME_CACHE_PATH); follows the realtime cache backend unless set
+    PROVIDER_BUDGET_BACKEND = os.getenv('PROVIDER_BUDGET_BACKEND', REALTIME_CACHE_BACKEND)
+    
     # Model paths
-    MODEL_PATH = os.path.join('..', 'ml_model', 'aqi_model.pkl')
-    SCALER_PATH = os.path.join('..', 'ml_model', 'scaler.pkl')
-    FEATURES_PATH = os.path.join('..', 'ml_model', 'feature_names.pkl')
+    MODEL_DIR = os.getenv('MODEL_DIR', os.path.normpath(os.path.join(BASE_DIR, '..', 'ml_model')))
+    MODEL_PATH = os.path.join(MODEL_DIR, 'aqi_model.pkl')
+    SCALER_PATH = os.path.join(MODEL_DIR, 'scaler.pkl')
+    FEATURES_PATH = os.path.join(MODEL_DIR, 'feature_names.pkl')
+    
+    # Model loading: 'background' (warm-up thread), 'eager' or 'lazy'
+    MODEL_LOADING = os.getenv('MODEL_LOADING', 'background')
+    MODEL_WAIT_TIMEOUT = float(os.getenv('MODEL_WAIT_TIMEOUT', '10'))
+    
+    # Map / spatial index
+    MAP_CELL_SIZE_DEG = float(os.getenv('MAP_CELL_SIZE_DEG', '1.0'))
+    MAP_MAX_ZOOM = int(os.getenv('MAP_MAX_ZOOM', '10'))
+    # Station readings older than this stop feeding the map and interpolation
+    MAP_STATION_MAX_AGE = int(os.getenv('MAP_STATION_MAX_AGE', str(REALTIME_STALE_MAX_AGE)))
+    
+    # Spatial interpolation (IDW over stored station readings)
+    INTERPOLATION_POWER = float(os.getenv('INTERPOLATION_POWER', '2.0'))
+    INTERPOLATION_NEIGHBOURS = int(os.getenv('INTERPOLATION_NEIGHBOURS', '8'))
+    INTERPOLATION_MAX_KM = float(os.getenv('INTERPOLATION_MAX_KM', '150'))
+    HEATMAP_MAX_CELLS = int(os.getenv('HEATMAP_MAX_CELLS', '10000'))
+    
+    # Shadow scoring of realtime readings (model vs IQAir's reported AQI)
+    MONITOR_ENABLED = os.getenv('MONITOR_ENABLED', 'True') == 'True'
+    MONITOR_WINDOW = int(os.getenv('MONITOR_WINDOW', '500'))
+    MONITOR_BATCH_SIZE = int(os.getenv('MONITOR_BATCH_SIZE', '32'))
+    MONITOR_FLUSH_SECONDS = float(os.getenv('MONITOR_FLUSH_SECONDS', '5'))
+    MONITOR_MAE_ALERT = float(os.getenv('MONITOR_MAE_ALERT', '25'))
+    MONITOR_DRIFT_ALERT = float(os.getenv('MONITOR_DRIFT_ALERT', '1.0'))
+    
+    # Stored realtime readings used for incremental retraining
+    HISTORY_ENABLED = os.getenv('HISTORY_ENABLED', 'True') == 'True'
+    HISTORY_PATH = os.getenv('HISTORY_PATH', os.path.join(BASE_DIR, 'data', 'readings.sqlite3'))
     
     # MongoDB (optional)
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/aqi_db')
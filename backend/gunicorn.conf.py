@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for serving the backend on many cores.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Override with environment variables:
+    BIND             address to listen on (default 0.0.0.0:5000)
+    WEB_CONCURRENCY  worker processes (default: one per CPU core)
+    GUNICORN_THREADS threads per worker (default 4)
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# /api/predict is CPU bound, so one worker process per core. /api/realtime
+# mostly waits on upstream HTTP, so each worker also runs a few threads.
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+
+# Import the app (and load the model) in the master before forking
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
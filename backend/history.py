@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Model feature name -> column name in the readings table
+COLUMNS = {
+    'PM2.5': 'pm25',
+    'PM10': 'pm10',
+    'NO2': 'no2',
+    'SO2': 'so2',
+    'CO': 'co',
+    'O3': 'o3',
+    'Temperature': 'temperature',
+    'Humidity': 'humidity',
+    'Wind_Speed': 'wind_speed',
+    'Pressure': 'pressure',
+}
+
+
+class ReadingHistory:
+    """
+    Append-only SQLite store of realtime readings that carry a true AQI.
+
+    Rows get increasing integer ids, so consumers such as the retraining
+    job can pull only what arrived since their last run with an indexed
+    `id > ?` range scan.
+
+    IQAir updates a station about once an hour while the backend may fetch
+    it every few minutes, so a reading is stored once per location and
+    provider measurement time (`measured_at`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        feature_columns = ', '.join(f'{col} REAL' for col in COLUMNS.values())
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS readings ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at REAL NOT NULL, '
+            'location TEXT, source TEXT, lat REAL, lon REAL, '
+            f'{feature_columns}, aqi REAL NOT NULL, measured_at TEXT)'
+        )
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(readings)')}
+        if 'measured_at' not in existing:
+            conn.execute('ALTER TABLE readings ADD COLUMN measured_at TEXT')
+        # NULL measured_at values never collide, so readings without one are all kept
+        conn.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS readings_location_measured_at '
+            'ON readings (location, measured_at)'
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, location, source, coordinates, features, aqi, measured_at=None):
+        """
+        Store one reading; `features` is keyed by model feature name.
+
+        Returns False if this location's reading for `measured_at` is already stored.
+        """
+        coordinates = coordinates or {}
+        columns = ['recorded_at', 'location', 'source', 'lat', 'lon'] + list(COLUMNS.values()) + ['aqi', 'measured_at']
+        values = [time.time(), location, source, coordinates.get('lat'), coordinates.get('lon')]
+        values += [features.get(name) for name in COLUMNS] + [aqi, measured_at]
+        placeholders = ', '.join('?' for _ in columns)
+        cur = self._conn().execute(
+            f'INSERT OR IGNORE INTO readings ({", ".join(columns)}) VALUES ({placeholders})',
+            values
+        )
+        return cur.rowcount == 1
+
+    def since(self, last_id=0, limit=None):
+        """Rows with id > last_id in id order, as dicts keyed by model feature name"""
+        select = ', '.join(['id', 'recorded_at', 'location'] + [f'{col}' for col in COLUMNS.values()] + ['aqi'])
+        sql = f'SELECT {select} FROM readings WHERE id > ? ORDER BY id'
+        params = [last_id]
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        rows = []
+        for row in self._conn().execute(sql, params):
+            record = {'id': row[0], 'recorded_at': row[1], 'location': row[2]}
+            record.update(zip(COLUMNS, row[3:3 + len(COLUMNS)]))
+            record['AQI'] = row[-1]
+            rows.append(record)
+        return rows
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM readings').fetchone()[0]
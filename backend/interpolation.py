@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+
+from spatial import EARTH_RADIUS_KM, KM_PER_DEGREE
+
+POLLUTANTS = ['PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'O3']
+
+
+class IDWInterpolator:
+    """
+    Inverse-distance-weighted estimates of AQI and pollutants from the
+    readings held in a StationIndex.
+
+    Station coordinates and values are packed into numpy arrays once per
+    index version, and a whole batch of query points is evaluated in
+    vectorized chunks. Each chunk only sees the stations in its latitude
+    band, and chunks are sized so that queries x stations stays under
+    max_elements, which bounds memory however many stations are indexed.
+    """
+
+    def __init__(self, station_index, power=2.0, neighbours=8, max_km=150.0, max_elements=2 ** 18):
+        self.station_index = station_index
+        self.power = float(power)
+        self.neighbours = int(neighbours)
+        self.max_km = float(max_km)
+        self.max_elements = int(max_elements)
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _arrays(self):
+        """Return (version, lat_rad, lon_rad, values, updated_at, stations) for the current index"""
+        self.station_index.expire()
+        version = self.station_index.version
+        snap = self._snapshot
+        if snap is not None and snap[0] == version:
+            return snap
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap[0] == version:
+                return snap
+            stations = self.station_index.stations()
+            lat = np.radians([s['lat'] for s in stations])
+            lon = np.radians([s['lon'] for s in stations])
+            values = np.array(
+                [[s['aqi']] + [float(s['pollutants'].get(p, 0) or 0) for p in POLLUTANTS] for s in stations],
+                dtype=float
+            ).reshape(len(stations), len(POLLUTANTS) + 1)
+            updated = np.array([s['updated_at'] for s in stations], dtype=float)
+            snap = (version, lat, lon, values, updated, stations)
+            self._snapshot = snap
+            return snap
+
+    def _distances(self, q_lat, q_lon, s_lat, s_lon):
+        """Haversine distance matrix (queries x stations) in kilometres"""
+        dlat = s_lat[None, :] - q_lat[:, None]
+        dlon = s_lon[None, :] - q_lon[:, None]
+        a = np.sin(dlat / 2) ** 2 + np.cos(q_lat)[:, None] * np.cos(s_lat)[None, :] * np.sin(dlon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def interpolate(self, lats, lons):
+        """
+        Estimate values at many points at once.
+
+        Returns a dict with an (N, 7) `values` array (AQI followed by
+        POLLUTANTS, NaN where no station is within max_km), the number of
+        stations used per point, the distance to the nearest station and
+        when the oldest reading used per point was stored (NaN if none).
+        """
+        q_lat = np.radians(np.asarray(lats, dtype=float).ravel())
+        q_lon = np.radians(np.asarray(lons, dtype=float).ravel())
+        n = q_lat.shape[0]
+        _, s_lat, s_lon, s_values, s_updated, _ = self._arrays()
+
+        out = np.full((n, len(POLLUTANTS) + 1), np.nan)
+        used = np.zeros(n, dtype=int)
+        nearest_km = np.full(n, np.nan)
+        oldest = np.full(n, np.nan)
+        empty = {'values': out, 'stations_used': used, 'nearest_km': nearest_km, 'oldest_updated_at': oldest}
+        if n == 0 or s_lat.shape[0] == 0:
+            return empty
+
+        # Stations further than max_km in latitude alone can never contribute
+        margin = np.radians(self.max_km / KM_PER_DEGREE)
+        chunk_size = max(1, self.max_elements // s_lat.shape[0])
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            c_lat, c_lon = q_lat[start:stop], q_lon[start:stop]
+            band = (s_lat >= c_lat.min() - margin) & (s_lat <= c_lat.max() + margin)
+            if not band.any():
+                continue
+            b_lat, b_lon, b_values, b_updated = s_lat[band], s_lon[band], s_values[band], s_updated[band]
+            k = min(self.neighbours, b_lat.shape[0])
+            dist = self._distances(c_lat, c_lon, b_lat, b_lon)
+
+            if k < dist.shape[1]:
+                idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                dist = np.take_along_axis(dist, idx, axis=1)
+            else:
+                idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+
+            in_range = dist <= self.max_km
+            # Clamp very small distances so a query on top of a station
+            # returns (almost exactly) that station's reading.
+            weights = np.where(in_range, 1.0 / np.maximum(dist, 1e-6) ** self.power, 0.0)
+            total = weights.sum(axis=1)
+            has_data = total > 0
+
+            weighted = np.einsum('qk,qkv->qv', weights, b_values[idx])
+            chunk = np.full_like(weighted, np.nan)
+            chunk[has_data] = weighted[has_data] / total[has_data, None]
+
+            out[start:stop] = chunk
+            used[start:stop] = in_range.sum(axis=1)
+            nearest_km[start:stop] = dist.min(axis=1)
+            chunk_oldest = np.where(in_range, b_updated[idx], np.inf).min(axis=1)
+            oldest[start:stop] = np.where(np.isinf(chunk_oldest), np.nan, chunk_oldest)
+
+        return empty
+
+        k = min(self.neighbours, s_lat.shape[0])
+        for start in range(0, n, self.chunk_size):
+            stop = min(start + self.chunk_size, n)
+            dist = self._distances(q_lat[start:stop], q_lon[start:stop], s_lat, s_lon)
+
+            if k < dist.shape[1]:
+                idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                dist = np.take_along_axis(dist, idx, axis=1)
+            else:
+                idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+
+            in_range = dist <= self.max_km
+            # Clamp very small distances so a query on top of a station
+            # returns (almost exactly) that station's reading.
+            weights = np.where(in_range, 1.0 / np.maximum(dist, 1e-6) ** self.power, 0.0)
+            total = weights.sum(axis=1)
+            has_data = total > 0
+
+            weighted = np.einsum('qk,qkv->qv', weights, s_values[idx])
+            chunk = np.full_like(weighted, np.nan)
+            chunk[has_data] = weighted[has_data] / total[has_data, None]
+
+            out[start:stop] = chunk
+            used[start:stop] = in_range.sum(axis=1)
+            nearest_km[start:stop] = dist.min(axis=1)
+            chunk_oldest = np.where(in_range, s_updated[idx], np.inf).min(axis=1)
+            oldest[start:stop] = np.where(np.isinf(chunk_oldest), np.nan, chunk_oldest)
+
+        return empty
+
+    def estimate(self, lat, lon):
+        """Estimate AQI and pollutants at a single point, or None if out of range"""
+        result = self.interpolate([lat], [lon])
+        row = result['values'][0]
+        if np.isnan(row[0]):
+            return None
+        return {
+            'aqi': float(row[0]),
+            'pollutants': {p: float(v) for p, v in zip(POLLUTANTS, row[1:])},
+            'stations_used': int(result['stations_used'][0]),
+            'nearest_km': float(result['nearest_km'][0]),
+            'updated_at': float(result['oldest_updated_at'][0]),
+        }
+
+    def grid(self, south, west, north, east, rows, cols):
+        """Estimate AQI on a regular rows x cols grid covering a viewport"""
+        lats = np.linspace(north, south, rows)
+        if west > east:
+            east += 360.0
+        lons = np.linspace(west, east, cols)
+        lons = np.where(lons > 180.0, lons - 360.0, lons)
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        result = self.interpolate(lat_grid, lon_grid)
+        return lats, lons, result['values'][:, 0].reshape(rows, cols)
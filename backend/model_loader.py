@@ -0,0 +1,93 @@
+import threading
+import time
+
+# Model loading states reported by /api/health and /api/ready
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ModelHandle:
+    """
+    Holds the model, scaler and feature names, and loads them on demand.
+
+    joblib (and through it scikit-learn, numpy and pandas) is only imported
+    when the model is actually loaded, so importing the app stays cheap.
+    The load can run synchronously, in a background warm-up thread, or
+    lazily on the first request that needs the model.
+    """
+
+    def __init__(self, model_path, scaler_path, features_path):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.features_path = features_path
+        self.model = None
+        self.scaler = None
+        self.feature_names = None
+        self.status = PENDING
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.status == READY
+
+    def load(self):
+        """Load the artifacts in the calling thread (no-op if already attempted)"""
+        with self._lock:
+            if self._done.is_set():
+                return self.ready
+            self.status = LOADING
+            started = time.perf_counter()
+            try:
+                import joblib
+                # Warm the heavy imports used at predict time while we're here
+                import pandas  # noqa: F401
+
+                self.model = joblib.load(self.model_path)
+                self.scaler = joblib.load(self.scaler_path)
+                self.feature_names = joblib.load(self.features_path)
+                self.status = READY
+                print("✅ ML Model loaded successfully")
+            except Exception as e:
+                self.model = self.scaler = self.feature_names = None
+                self.status = FAILED
+                self.error = str(e)
+                print(f"❌ Error loading model: {e}")
+            finally:
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self._done.set()
+            return self.ready
+
+    def start_background(self):
+        """Start loading in a daemon warm-up thread"""
+        with self._lock:
+            if self._thread is not None or self._done.is_set():
+                return
+            self._thread = threading.Thread(target=self.load, name='model-warmup', daemon=True)
+            self._thread.start()
+
+    def ensure_loaded(self, timeout=None):
+        """
+        Make sure a load has been attempted and return whether the model is ready.
+
+        If a background load is in flight, wait up to `timeout` seconds for it;
+        otherwise load synchronously.
+        """
+        if self._done.is_set():
+            return self.ready
+        if self._thread is not None:
+            self._done.wait(timeout)
+            return self.ready
+        return self.load()
+
+    def snapshot(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'load_seconds': self.load_seconds,
+        }
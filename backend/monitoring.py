@@ -0,0 +1,447 @@
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+FEATURES = ['PM2.5', 'PM10', 'NO2', 'SO2', 'CO', 'O3', 'Temperature', 'Humidity', 'Wind_Speed', 'Pressure']
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate in O(1) memory (Jain & Chlamtac's P² algorithm).
+
+    Keeps five markers whose heights track the min, p/2, p, (1+p)/2 and max
+    of everything seen so far.
+    """
+
+    __slots__ = ('p', 'n', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p):
+        self.p = p
+        self.n = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.n += 1
+        if self.n <= 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+
+        h = self.heights
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - self.positions[i]
+            if (d >= 1 and self.positions[i + 1] - self.positions[i] > 1) or \
+               (d <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not h[i - 1] < candidate < h[i + 1]:
+                    candidate = h[i] + step * (h[i + step] - h[i]) / (self.positions[i + step] - self.positions[i])
+                h[i] = candidate
+                self.positions[i] += step
+
+    def _parabolic(self, i, step):
+        h, n = self.heights, self.positions
+        return h[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self.n == 0:
+            return None
+        if self.n <= 5:
+            ordered = sorted(self.heights)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return self.heights[2]
+
+
+def summarize_errors(errors):
+    """Sample count, MAE, RMSE and bias of a list of (predicted - actual) errors"""
+    if not errors:
+        return {'samples': 0, 'mae': None, 'rmse': None, 'bias': None}
+    n = len(errors)
+    return {
+        'samples': n,
+        'mae': round(sum(abs(e) for e in errors) / n, 2),
+        'rmse': round(math.sqrt(sum(e * e for e in errors) / n), 2),
+        'bias': round(sum(errors) / n, 2),
+    }
+
+
+class LocationStats:
+    """Rolling shadow-scoring errors and feature sketches for one location"""
+
+    def __init__(self, window):
+        self.errors = deque(maxlen=window)
+        self.count = 0
+        self.last_seen = None
+        self.sketches = {f: [P2Quantile(q) for q in QUANTILES] for f in FEATURES}
+
+    def update(self, features, actual, predicted):
+        self.count += 1
+        self.last_seen = time.time()
+        self.errors.append(predicted - actual)
+        for name, sketches in self.sketches.items():
+            value = features.get(name)
+            if value is not None:
+                for sketch in sketches:
+                    sketch.add(float(value))
+
+    def error_summary(self):
+        return summarize_errors(list(self.errors))
+
+    def quantile(self, name, q):
+        return self.sketches[name][QUANTILES.index(q)].value()
+
+    def feature_summary(self):
+        return {
+            name: {f'p{int(q * 100)}': (round(s.value(), 3) if s.value() is not None else None)
+                   for q, s in zip(QUANTILES, sketches)}
+            for name, sketches in self.sketches.items()
+        }
+
+
+class WindowStats:
+    """
+    Same report interface as LocationStats, computed from a window of
+    scores read back from a SqliteScoreStore. The window is small, so
+    feature quantiles are exact rather than P² estimates.
+    """
+
+    def __init__(self, rows, count, last_seen):
+        self.errors = [predicted - actual for actual, predicted, _ in rows]
+        self.count = count
+        self.last_seen = last_seen
+        self.values = {
+            name: sorted(features[name] for _, _, features in rows if features.get(name) is not None)
+            for name in FEATURES
+        }
+
+    def error_summary(self):
+        return summarize_errors(self.errors)
+
+    def quantile(self, name, q):
+        ordered = self.values[name]
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def feature_summary(self):
+        return {
+            name: {f'p{int(q * 100)}': (round(self.quantile(name, q), 3) if self.values[name] else None)
+                   for q in QUANTILES}
+            for name in FEATURES
+        }
+
+
+class SqliteScoreStore:
+    """
+    Shadow scores kept in a SQLite file shared by every worker process, so
+    /api/monitoring reports the same numbers whichever worker answers.
+
+    Only the last `window` scores per location are kept, plus a running
+    count and last-seen time per location.
+    """
+
+    COLUMNS = [name.replace('.', '').lower() for name in FEATURES]
+
+    def __init__(self, path, window=500):
+        self.path = path
+        self.window = int(window)
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        feature_columns = ', '.join(f'{col} REAL' for col in self.COLUMNS)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS shadow_scores ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, location TEXT NOT NULL, '
+            f'actual REAL NOT NULL, predicted REAL NOT NULL, {feature_columns})'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS shadow_scores_location ON shadow_scores (location, id)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS shadow_totals ('
+            'location TEXT PRIMARY KEY, scored INTEGER NOT NULL, last_seen REAL NOT NULL)'
+        )
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are keyed by pid as well as thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, scored):
+        """Store a batch of (location, features, actual, predicted)"""
+        now = time.time()
+        columns = ', '.join(['location', 'actual', 'predicted'] + self.COLUMNS)
+        placeholders = ', '.join('?' for _ in range(3 + len(self.COLUMNS)))
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f'INSERT INTO shadow_scores ({columns}) VALUES ({placeholders})',
+                [[location, actual, predicted] + [features.get(name) for name in FEATURES]
+                 for location, features, actual, predicted in scored]
+            )
+            conn.executemany(
+                'INSERT INTO shadow_totals (location, scored, last_seen) VALUES (?, 1, ?) '
+                'ON CONFLICT (location) DO UPDATE SET scored = scored + 1, last_seen = excluded.last_seen',
+                [(location, now) for location, _, _, _ in scored]
+            )
+            self._writes += 1
+            if self._writes % 20 == 0:
+                conn.execute(
+                    'DELETE FROM shadow_scores WHERE id IN (SELECT id FROM ('
+                    'SELECT id, ROW_NUMBER() OVER (PARTITION BY location ORDER BY id DESC) AS rn '
+                    'FROM shadow_scores) WHERE rn > ?)',
+                    (self.window,)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _rows(self, sql, params):
+        rows = []
+        for row in self._conn().execute(sql, params):
+            features = {name: value for name, value in zip(FEATURES, row[3:]) if value is not None}
+            rows.append((row[0], (row[1], row[2], features)))
+        return rows
+
+    def recent(self, location=None):
+        """{location: [(actual, predicted, features), ...]} for the last `window` scores per location"""
+        where, params = ('WHERE location = ?', [location]) if location is not None else ('', [])
+        columns = ', '.join(['location', 'actual', 'predicted'] + self.COLUMNS)
+        by_location = {}
+        for loc, row in self._rows(
+            f'SELECT {columns} FROM (SELECT *, ROW_NUMBER() OVER '
+            f'(PARTITION BY location ORDER BY id DESC) AS rn FROM shadow_scores {where}) '
+            'WHERE rn <= ? ORDER BY id',
+            params + [self.window]
+        ):
+            by_location.setdefault(loc, []).append(row)
+        return by_location
+
+    def recent_overall(self):
+        """The last `window` scores across all locations"""
+        columns = ', '.join(['location', 'actual', 'predicted'] + self.COLUMNS)
+        rows = self._rows(
+            f'SELECT {columns} FROM shadow_scores ORDER BY id DESC LIMIT ?', [self.window]
+        )
+        return [row for _, row in reversed(rows)]
+
+    def totals(self):
+        """{location: (scored, last_seen)}"""
+        return {
+            location: (scored, last_seen)
+            for location, scored, last_seen in self._conn().execute(
+                'SELECT location, scored, last_seen FROM shadow_totals'
+            )
+        }
+
+
+class ShadowScorer:
+    """
+    Scores realtime readings with the loaded model in the background and
+    compares the prediction with the AQI the provider reported.
+
+    submit() only enqueues (and drops when the queue is full), so the
+    request path pays a few microseconds. A worker thread drains the queue
+    in batches and runs one vectorized predict per batch.
+
+    `reference` is an optional callable returning {feature: {'mean', 'std'}}
+    from training, used to score feature drift.
+
+    With a `store` (SqliteScoreStore), scores go to shared storage and
+    snapshot() reads them back, so every worker process reports the same
+    statistics. The pipeline counters stay per process.
+    """
+
+    def __init__(self, predict_batch, is_ready, window=500, batch_size=32, flush_interval=5.0,
+                 max_queue=1000, reference=None, mae_alert=25.0, drift_alert=1.0, min_samples=20, store=None):
+        self.predict_batch = predict_batch
+        self.is_ready = is_ready
+        self.window = window
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._reference_fn = reference
+        self._reference = None
+        self.mae_alert = mae_alert
+        self.drift_alert = drift_alert
+        self.min_samples = min_samples
+        self.store = store
+        self.locations = {}
+        self.overall = LocationStats(window)
+        self.submitted = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.batches = 0
+        self.score_seconds = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # Threads don't survive fork(), so (re)start per process on first use
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+            self._thread.start()
+
+    def submit(self, location, features, actual):
+        """Queue one reading for scoring; never blocks the caller"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((location, features, float(actual)))
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.score(batch)
+            except Exception as e:
+                print(f"Shadow scoring failed: {e}")
+
+    def score(self, batch):
+        """Predict a batch of (location, features, actual) and update statistics"""
+        if not self.is_ready():
+            self.skipped += len(batch)
+            return
+        started = time.perf_counter()
+        predictions = self.predict_batch([features for _, features, _ in batch])
+        if self.store is not None:
+            self.store.add([(location, features, actual, float(predicted))
+                            for (location, features, actual), predicted in zip(batch, predictions)])
+            with self._lock:
+                self.batches += 1
+                self.score_seconds += time.perf_counter() - started
+            return
+        with self._lock:
+            for (location, features, actual), predicted in zip(batch, predictions):
+                stats = self.locations.get(location)
+                if stats is None:
+                    stats = self.locations[location] = LocationStats(self.window)
+                stats.update(features, actual, float(predicted))
+                self.overall.update(features, actual, float(predicted))
+            self.batches += 1
+            self.score_seconds += time.perf_counter() - started
+
+    def _training_reference(self):
+        if self._reference is None and self._reference_fn is not None and self.is_ready():
+            self._reference = self._reference_fn()
+        return self._reference
+
+    def _drift(self, stats):
+        """Distance of each live feature median from the training mean, in training std units"""
+        reference = self._training_reference()
+        if not reference:
+            return {}
+        drift = {}
+        for name in FEATURES:
+            ref = reference.get(name)
+            median = stats.quantile(name, 0.5)
+            if ref is None or median is None or not ref['std']:
+                continue
+            drift[name] = round(abs(median - ref['mean']) / ref['std'], 3)
+        return drift
+
+    def _location_report(self, stats):
+        errors = stats.error_summary()
+        drift = self._drift(stats)
+        drifted = sorted(name for name, score in drift.items() if score > self.drift_alert)
+        enough = errors['samples'] >= self.min_samples
+        return {
+            'errors': errors,
+            'total_scored': stats.count,
+            'last_seen': stats.last_seen,
+            'features': stats.feature_summary(),
+            'drift': drift,
+            'drifted_features': drifted,
+            'retrain_recommended': enough and (errors['mae'] > self.mae_alert or bool(drifted)),
+        }
+
+    def _stored_stats(self, location=None):
+        """(overall, {location: stats}) rebuilt from the shared store"""
+        totals = self.store.totals()
+        locations = {
+            name: WindowStats(rows, *totals.get(name, (len(rows), None)))
+            for name, rows in self.store.recent(location).items()
+        }
+        overall = None
+        if location is None:
+            overall = WindowStats(
+                self.store.recent_overall(),
+                sum(scored for scored, _ in totals.values()),
+                max((seen for _, seen in totals.values()), default=None)
+            )
+        return overall, locations
+
+    def snapshot(self, location=None):
+        if self.store is not None:
+            overall, locations = self._stored_stats(location)
+        with self._lock:
+            if self.store is None:
+                overall, locations = self.overall, self.locations
+            if location is not None:
+                stats = locations.get(location)
+                return {location: self._location_report(stats)} if stats else {}
+            return {
+                'overall': self._location_report(overall),
+                'locations': {name: self._location_report(s) for name, s in locations.items()},
+                'pipeline': {
+                    'submitted': self.submitted,
+                    'dropped': self.dropped,
+                    'skipped_model_not_ready': self.skipped,
+                    'queued': self._queue.qsize(),
+                    'batches': self.batches,
+                    'avg_batch_ms': round(self.score_seconds / self.batches * 1000, 2) if self.batches else None,
+                },
+            }
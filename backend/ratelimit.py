@@ -0,0 +1,337 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Provider admission decisions
+ADMIT = 'admit'          # plenty of budget left
+RESERVE = 'reserve'      # quota nearly used up; only spend it if nothing else works
+DENY = 'deny'            # per-minute limit hit or quota exhausted
+
+RATE_WINDOW_SECONDS = 60.0
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def peek(self, now):
+        self._refill(now)
+        return self.tokens
+
+    def take(self, cost=1.0, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def retry_after(self, cost=1.0):
+        """Seconds until `cost` tokens are available"""
+        missing = cost - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float('inf')
+
+
+class ClientRateLimiter:
+    """Per-client token buckets keyed by client id (e.g. remote address)"""
+
+    def __init__(self, rate_per_minute, burst, idle_seconds=600):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_prune = time.monotonic() + idle_seconds
+        self.allowed = 0
+        self.rejected = 0
+
+    def allow(self, client_id):
+        """Return (allowed, retry_after_seconds) for one request from client_id"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst, now)
+            if now >= self._next_prune:
+                self._prune(now)
+            if bucket.take(1.0, now):
+                self.allowed += 1
+                return True, 0.0
+            self.rejected += 1
+            return False, bucket.retry_after(1.0)
+
+    def _prune(self, now):
+        # A bucket idle long enough to be full again carries no state worth keeping
+        cutoff = now - self.idle_seconds
+        self._buckets = {k: b for k, b in self._buckets.items() if b.updated >= cutoff}
+        self._next_prune = now + self.idle_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'tracked_clients': len(self._buckets),
+            }
+
+
+class ProviderBudget:
+    """
+    Per-minute rate limit plus a fixed-window quota for one upstream provider.
+
+    The rate limit counts calls in a rolling 60 second window, so no span
+    of 60 seconds ever holds more calls than the provider's quoted limit.
+
+    admit() tells the caller whether spending a call is fine, should be
+    avoided because the quota is nearly exhausted (RESERVE), or is not
+    possible at all (DENY). Nothing is consumed until spend() is called.
+
+    State lives in this process; SqliteProviderBudget shares it between
+    worker processes.
+    """
+
+    def __init__(self, name, rate_per_minute, quota, window_seconds, reserve_fraction=0.1):
+        self.name = name
+        self.rate_per_minute = max(1, int(rate_per_minute))
+        self.quota = int(quota)
+        self.window_seconds = float(window_seconds)
+        self.reserve = int(self.quota * reserve_fraction)
+        self.used = 0
+        self.window_start = time.time()
+        self._recent = deque()  # monotonic timestamps of calls in the last minute
+        self.spent_calls = 0
+        self.denied = 0
+        self.reserve_spent = 0
+        self._lock = threading.Lock()
+
+    def _roll_window(self, now):
+        if now - self.window_start >= self.window_seconds:
+            self.window_start = now
+            self.used = 0
+
+    def _recent_calls(self, now):
+        cutoff = now - RATE_WINDOW_SECONDS
+        while self._recent and self._recent[0] <= cutoff:
+            self._recent.popleft()
+        return len(self._recent)
+
+    def _usage(self):
+        """Return (used, window_start, calls_in_last_minute)"""
+        self._roll_window(time.time())
+        return self.used, self.window_start, self._recent_calls(time.monotonic())
+
+    def _consume(self, cost):
+        """Record `cost` calls if both limits allow it; returns whether it did"""
+        used, _, recent = self._usage()
+        if used + cost > self.quota or recent + cost > self.rate_per_minute:
+            return False
+        self._recent.extend([time.monotonic()] * cost)
+        self.used += cost
+        return True
+
+    def admit(self, cost=1):
+        with self._lock:
+            used, _, recent = self._usage()
+            remaining = max(0, self.quota - used)
+            if remaining < cost or recent + cost > self.rate_per_minute:
+                return DENY
+            if remaining - cost < self.reserve:
+                return RESERVE
+            return ADMIT
+
+    def spend(self, cost=1, reserve=False):
+        """Consume budget for a call; returns False if it was taken in the meantime"""
+        with self._lock:
+            if not self._consume(cost):
+                self.denied += 1
+                return False
+            self.spent_calls += cost
+            if reserve:
+                self.reserve_spent += cost
+            return True
+
+    def note_denied(self):
+        with self._lock:
+            self.denied += 1
+
+    def snapshot(self):
+        with self._lock:
+            used, window_start, recent = self._usage()
+            return {
+                'quota': self.quota,
+                'used': used,
+                'remaining': max(0, self.quota - used),
+                'reserve': self.reserve,
+                'window_resets_in': round(max(0.0, window_start + self.window_seconds - time.time()), 1),
+                'calls_last_minute': recent,
+                'rate_per_minute': self.rate_per_minute,
+                'calls': self.spent_calls,
+                'calls_from_reserve': self.reserve_spent,
+                'denied': self.denied,
+            }
+
+
+class SqliteProviderBudget(ProviderBudget):
+    """
+    ProviderBudget whose quota usage and last-minute calls live in a SQLite
+    file, so every worker process on the host draws from one budget.
+
+    Each spend runs in a single IMMEDIATE transaction and the quota is
+    taken with `UPDATE ... WHERE used + ? <= quota`, so concurrent workers
+    can never overspend. The calls/denied counters stay per process.
+    """
+
+    def __init__(self, path, name, rate_per_minute, quota, window_seconds, reserve_fraction=0.1):
+        super().__init__(name, rate_per_minute, quota, window_seconds, reserve_fraction)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS provider_quota ('
+            'name TEXT PRIMARY KEY, window_start REAL NOT NULL, used INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS provider_calls (name TEXT NOT NULL, at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS provider_calls_name_at ON provider_calls (name, at)')
+        conn.execute(
+            'INSERT OR IGNORE INTO provider_quota (name, window_start, used) VALUES (?, ?, 0)',
+            (name, time.time())
+        )
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are keyed by pid as well as thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _read_usage(self, conn, now):
+        conn.execute(
+            'UPDATE provider_quota SET window_start = ?, used = 0 WHERE name = ? AND window_start <= ?',
+            (now, self.name, now - self.window_seconds)
+        )
+        used, window_start = conn.execute(
+            'SELECT used, window_start FROM provider_quota WHERE name = ?', (self.name,)
+        ).fetchone()
+        recent = conn.execute(
+            'SELECT COUNT(*) FROM provider_calls WHERE name = ? AND at > ?',
+            (self.name, now - RATE_WINDOW_SECONDS)
+        ).fetchone()[0]
+        return used, window_start, recent
+
+    def _usage(self):
+        return self._read_usage(self._conn(), time.time())
+
+    def _consume(self, cost):
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'DELETE FROM provider_calls WHERE name = ? AND at <= ?',
+                (self.name, now - RATE_WINDOW_SECONDS)
+            )
+            _, _, recent = self._read_usage(conn, now)
+            ok = recent + cost <= self.rate_per_minute
+            if ok:
+                cur = conn.execute(
+                    'UPDATE provider_quota SET used = used + ? WHERE name = ? AND used + ? <= ?',
+                    (cost, self.name, cost, self.quota)
+                )
+                ok = cur.rowcount == 1
+            if ok:
+                conn.executemany(
+                    'INSERT INTO provider_calls (name, at) VALUES (?, ?)',
+                    [(self.name, now)] * cost
+                )
+            conn.execute('COMMIT')
+            return ok
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def create_provider_budget(backend, name, rate_per_minute, quota, window_seconds, reserve_fraction=0.1,
+                           path=None):
+    """Build a provider budget for the configured backend ('memory' or 'sqlite')"""
+    if backend == 'sqlite':
+        return SqliteProviderBudget(path, name, rate_per_minute, quota, window_seconds, reserve_fraction)
+    if backend == 'memory':
+        return ProviderBudget(name, rate_per_minute, quota, window_seconds, reserve_fraction)
+    raise ValueError(f'Unknown budget backend: {backend}')
+
+
+class AdmissionController:
+    """Client rate limiting and quota-aware provider admission, with counters for /api/metrics"""
+
+    def __init__(self, client_limiter, providers):
+        self.clients = client_limiter
+        self.providers = {p.name: p for p in providers}
+        self.served_fresh_cache = 0
+        self.served_stale = 0
+        self.rerouted = 0
+        self.unavailable = 0
+        self._lock = threading.Lock()
+
+    def allow_client(self, client_id):
+        return self.clients.allow(client_id)
+
+    def plan(self, costs):
+        """
+        Split providers (in preference order) by admission decision.
+
+        costs: list of (provider_name, cost). Returns (admitted, reserve)
+        lists of (name, cost); denied providers are counted and dropped.
+        """
+        admitted, reserve = [], []
+        for name, cost in costs:
+            decision = self.providers[name].admit(cost)
+            if decision == ADMIT:
+                admitted.append((name, cost))
+            elif decision == RESERVE:
+                reserve.append((name, cost))
+            else:
+                self.providers[name].note_denied()
+        return admitted, reserve
+
+    def spend(self, name, cost, reserve=False):
+        return self.providers[name].spend(cost, reserve=reserve)
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            degradations = {
+                'served_fresh_cache': self.served_fresh_cache,
+                'served_stale': self.served_stale,
+                'rerouted': self.rerouted,
+                'unavailable': self.unavailable,
+            }
+        return {
+            'clients': self.clients.snapshot(),
+            'providers': {name: p.snapshot() for name, p in self.providers.items()},
+            'degradations': degradations,
+        }
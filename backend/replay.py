@@ -0,0 +1,167 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that carry API keys and must never reach the archive
+SECRET_PARAMS = {'key', 'appid'}
+MODES = ('live', 'record', 'replay')
+
+
+def normalize_url(url):
+    """Drop secret query parameters and sort the rest so URLs match across runs"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def _build_response(url, status_code, body):
+    import requests
+
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.encoding = 'utf-8'
+    response._content = body.encode('utf-8')
+    return response
+
+
+class UpstreamClient:
+    """
+    Thin wrapper around requests.get for the IQAir/OpenWeatherMap calls.
+
+    - live:   plain HTTP requests
+    - record: HTTP requests, each response and its latency is appended to
+              a gzip'd JSON-lines archive (API keys are stripped). Records
+              are buffered and compressed together, flush_every at a time
+    - replay: no network; responses are served from the archive, cycling
+              through recordings of the same URL, after sleeping for the
+              recorded latency multiplied by latency_scale
+    """
+
+    def __init__(self, mode='live', archive_path=None, latency_scale=1.0, flush_every=100, flush_seconds=30.0):
+        if mode not in MODES:
+            raise ValueError(f'Unknown upstream mode: {mode} (expected one of {", ".join(MODES)})')
+        if mode != 'live' and not archive_path:
+            raise ValueError(f'An archive path is required in {mode} mode')
+
+        self.mode = mode
+        self.archive_path = archive_path
+        self.latency_scale = float(latency_scale)
+        self._lock = threading.Lock()
+        self._recordings = {}
+        self._cursors = {}
+        self.flush_every = int(flush_every)
+        self.flush_seconds = float(flush_seconds)
+        self._buffer = []
+        self._buffer_pid = os.getpid()
+        self._last_flush = time.monotonic()
+
+        if mode == 'record':
+            atexit.register(self.flush)
+
+        if mode == 'replay':
+            self._recordings = self.load_archive(archive_path)
+            total = sum(len(v) for v in self._recordings.values())
+            print(f"▶️ Upstream replay mode: {total} recorded responses for {len(self._recordings)} URLs")
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def api_key(self, key):
+        """Return the configured key, or a placeholder so replay works without secrets"""
+        if not key and self.replaying:
+            return 'replay'
+        return key
+
+    # ---------- archive ----------
+
+    @staticmethod
+    def load_archive(path):
+        """Read an archive into {normalized_url: [entry, ...]} in recorded order"""
+        recordings = {}
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                recordings.setdefault(entry['url'], []).append(entry)
+        return recordings
+
+    def _append(self, entry):
+        with self._lock:
+            if self._buffer_pid != os.getpid():
+                # Inherited across fork: the parent writes those entries itself
+                self._buffer = []
+                self._buffer_pid = os.getpid()
+            self._buffer.append(json.dumps(entry, separators=(',', ':')) + '\n')
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+            if len(self._buffer) >= self.flush_every or due:
+                self._flush_locked()
+
+    def flush(self):
+        """Write buffered recordings to the archive"""
+        with self._lock:
+            if self._buffer_pid == os.getpid():
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        directory = os.path.dirname(self.archive_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One gzip member per batch, written with a single O_APPEND write so
+        # members from several worker processes never interleave. gzip
+        # readers treat concatenated members as one stream.
+        data = gzip.compress(''.join(self._buffer).encode('utf-8'))
+        self._buffer = []
+        fd = os.open(self.archive_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    # ---------- requests ----------
+
+    def get(self, url, **kwargs):
+        if self.mode == 'replay':
+            return self._replay(url)
+
+        import requests
+
+        started = time.perf_counter()
+        response = requests.get(url, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        if self.mode == 'record':
+            self._append({
+                'url': normalize_url(url),
+                'status': response.status_code,
+                'elapsed': round(elapsed, 6),
+                'body': response.text,
+                'recorded_at': time.time(),
+            })
+        return response
+
+    def _replay(self, url):
+        key = normalize_url(url)
+        with self._lock:
+            entries = self._recordings.get(key)
+            if not entries:
+                import requests
+                raise requests.exceptions.ConnectionError(f'No recorded response for {key}')
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = (cursor + 1) % len(entries)
+        entry = entries[cursor]
+
+        delay = entry.get('elapsed', 0) * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        return _build_response(url, entry['status'], entry['body'])
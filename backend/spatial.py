@@ -0,0 +1,343 @@
+import math
+import threading
+import time
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def wrap_lon(lon):
+    """Normalise a longitude into [-180, 180)"""
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def _wrap_east(lon):
+    """Normalise an eastern edge into (-180, 180], so east=180 stays 180"""
+    return -wrap_lon(-lon)
+
+
+def viewport_lons(west, east):
+    """
+    Normalise a viewport's west/east edges, as sent by a map that may have
+    been panned across the antimeridian (e.g. west=170, east=190).
+
+    Edges already inside [-180, 180] are left alone. Returns
+    (west, east, whole_world); west > east means the viewport crosses the
+    antimeridian.
+    """
+    if east - west >= 360.0:
+        return -180.0, 180.0, True
+    if not -180.0 <= west <= 180.0:
+        west = wrap_lon(west)
+    if not -180.0 <= east <= 180.0:
+        east = _wrap_east(east)
+    return west, east, False
+
+
+def lat_lon_to_tile(lat, lon, zoom):
+    """Convert a coordinate to Web Mercator (slippy map) tile x/y at a zoom level"""
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """Return the south/west/north/east bounds of a slippy map tile"""
+    n = 2 ** zoom
+
+    def tile_lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return {
+        'south': tile_lat(y + 1),
+        'west': x / n * 360.0 - 180.0,
+        'north': tile_lat(y),
+        'east': (x + 1) / n * 360.0 - 180.0,
+    }
+
+
+class _TileAggregate:
+    """Running AQI aggregate for the stations that fall inside one tile"""
+
+    __slots__ = ('members', 'total', 'max_aqi')
+
+    def __init__(self):
+        self.members = {}
+        self.total = 0.0
+        self.max_aqi = 0.0
+
+    def put(self, key, aqi):
+        old = self.members.get(key)
+        self.members[key] = aqi
+        self.total += aqi - (old or 0.0)
+        if aqi >= self.max_aqi:
+            self.max_aqi = aqi
+        elif old is not None and old >= self.max_aqi:
+            self.max_aqi = max(self.members.values())
+
+    def remove(self, key):
+        old = self.members.pop(key, None)
+        if old is None:
+            return
+        self.total -= old
+        if old >= self.max_aqi:
+            self.max_aqi = max(self.members.values(), default=0.0)
+
+    def summary(self):
+        count = len(self.members)
+        return {
+            'count': count,
+            'aqi': round(self.total / count, 1) if count else None,
+            'max_aqi': round(self.max_aqi, 1),
+        }
+
+
+class StationIndex:
+    """
+    In-memory spatial index over the latest reading of each station.
+
+    Stations are bucketed on a regular lat/lon grid so nearest-K and
+    bounding-box lookups only touch nearby cells. Per-tile AQI aggregates
+    are maintained for every zoom level as readings arrive, so tile
+    queries are plain dictionary reads and never hit the upstream APIs.
+
+    With max_age set, readings older than max_age seconds are evicted on
+    the next add or query, so old data stops feeding tiles and estimates.
+    """
+
+    def __init__(self, cell_size=1.0, max_zoom=10, max_age=None):
+        self.cell_size = float(cell_size)
+        self.max_zoom = int(max_zoom)
+        self.max_age = float(max_age) if max_age else None
+        self._lon_cells = int(math.ceil(360.0 / self.cell_size))
+        self._lat_cells = int(math.ceil(180.0 / self.cell_size))
+        self._stations = {}
+        self._cells = {}
+        self._tiles = [{} for _ in range(self.max_zoom + 1)]
+        self.version = 0
+        self._lock = threading.RLock()
+
+    # ---------- bookkeeping ----------
+
+    def _cell_of(self, lat, lon):
+        row = min(int((lat + 90.0) // self.cell_size), self._lat_cells - 1)
+        col = int(((lon + 180.0) % 360.0) // self.cell_size)
+        return row, col
+
+    @staticmethod
+    def station_key(reading):
+        coords = reading['coordinates']
+        return f"{round(coords['lat'], 4)},{round(coords['lon'], 4)}"
+
+    def __len__(self):
+        return len(self._stations)
+
+    def add(self, reading, at=None):
+        """Insert or replace the latest reading for a station (`at`: epoch seconds it was stored)"""
+        coords = reading.get('coordinates') or {}
+        lat, lon = coords.get('lat'), coords.get('lon')
+        if lat is None or lon is None or reading.get('aqi') is None:
+            return None
+
+        key = self.station_key(reading)
+        entry = {
+            'key': key,
+            'city': reading.get('city'),
+            'lat': float(lat),
+            'lon': float(lon),
+            'aqi': float(reading['aqi']),
+            'pollutants': dict(reading.get('pollutants') or {}),
+            'source': reading.get('source'),
+            'timestamp': reading.get('timestamp'),
+            'updated_at': time.time() if at is None else float(at),
+        }
+
+        with self._lock:
+            self._expire(time.time())
+            self._discard(key)
+            self._stations[key] = entry
+            self._cells.setdefault(self._cell_of(entry['lat'], entry['lon']), set()).add(key)
+            for zoom, tiles in enumerate(self._tiles):
+                tile = lat_lon_to_tile(entry['lat'], entry['lon'], zoom)
+                tiles.setdefault(tile, _TileAggregate()).put(key, entry['aqi'])
+            self.version += 1
+        return key
+
+    def _discard(self, key):
+        old = self._stations.pop(key, None)
+        if old is None:
+            return
+        cell = self._cell_of(old['lat'], old['lon'])
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+        for zoom, tiles in enumerate(self._tiles):
+            tile = lat_lon_to_tile(old['lat'], old['lon'], zoom)
+            agg = tiles.get(tile)
+            if agg is not None:
+                agg.remove(key)
+                if not agg.members:
+                    del tiles[tile]
+
+    def _expire(self, now):
+        # Stations are kept in arrival order (add() re-inserts at the end),
+        # so the expired ones are at the front
+        if self.max_age is None:
+            return
+        cutoff = now - self.max_age
+        expired = []
+        for key, st in self._stations.items():
+            if st['updated_at'] > cutoff:
+                break
+            expired.append(key)
+        for key in expired:
+            self._discard(key)
+        if expired:
+            self.version += 1
+
+    def expire(self):
+        """Evict readings older than max_age"""
+        with self._lock:
+            self._expire(time.time())
+
+    def stations(self):
+        """Snapshot of every stored station reading"""
+        with self._lock:
+            self._expire(time.time())
+            return list(self._stations.values())
+
+    # ---------- queries ----------
+
+    def _ring(self, row, col, radius):
+        """Yield grid cells on the square ring at the given radius"""
+        if radius == 0:
+            yield row, col
+            return
+        for r in range(row - radius, row + radius + 1):
+            if r < 0 or r >= self._lat_cells:
+                continue
+            if r in (row - radius, row + radius):
+                cols = range(col - radius, col + radius + 1)
+            else:
+                cols = (col - radius, col + radius)
+            for c in cols:
+                yield r, c % self._lon_cells
+
+    def nearest(self, lat, lon, k=5, max_km=None):
+        """Return up to k stations closest to (lat, lon), nearest first"""
+        if k <= 0:
+            return []
+        with self._lock:
+            self._expire(time.time())
+            if not self._stations:
+                return []
+            row, col = self._cell_of(lat, lon)
+            found = []
+            seen = set()
+            max_radius = max(self._lat_cells, self._lon_cells // 2 + 1)
+            for radius in range(max_radius + 1):
+                for cell in self._ring(row, col, radius):
+                    if cell in seen:
+                        continue
+                    seen.add(cell)
+                    for key in self._cells.get(cell, ()):
+                        st = self._stations[key]
+                        found.append((haversine_km(lat, lon, st['lat'], st['lon']), st))
+                if len(found) >= len(self._stations):
+                    break
+                # Anything outside this ring is at least `radius` cells away;
+                # scale by cos(lat) at the far edge so longitude shrinkage is covered.
+                edge_lat = min(89.9, abs(lat) + (radius + 1) * self.cell_size)
+                bound_km = radius * self.cell_size * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+                if len(found) >= k:
+                    found.sort(key=lambda item: item[0])
+                    if bound_km >= found[k - 1][0]:
+                        break
+                if max_km is not None and bound_km > max_km:
+                    break
+
+        found.sort(key=lambda item: item[0])
+        result = []
+        for dist, st in found[:k]:
+            if max_km is not None and dist > max_km:
+                break
+            result.append(dict(st, distance_km=round(dist, 2)))
+        return result
+
+    def within_bbox(self, south, west, north, east):
+        """Return stations inside a bounding box (handles antimeridian crossing)"""
+        west, east, whole_world = viewport_lons(west, east)
+        crosses = west > east
+        with self._lock:
+            self._expire(time.time())
+            row_lo, _ = self._cell_of(max(south, -90.0), 0.0)
+            row_hi, _ = self._cell_of(min(north, 90.0), 0.0)
+            _, col_lo = self._cell_of(0.0, west)
+            # east=180 is the far edge of the last column, not column 0
+            col_hi = self._lon_cells - 1 if east >= 180.0 else self._cell_of(0.0, east)[1]
+            if whole_world or (west <= -180.0 and east >= 180.0):
+                cols = range(self._lon_cells)
+            elif crosses:
+                cols = list(range(col_lo, self._lon_cells)) + list(range(0, col_hi + 1))
+            else:
+                cols = range(col_lo, col_hi + 1)
+                if east >= 180.0 and col_lo > 0:
+                    cols = list(cols) + [0]  # stations at exactly lon=180 are filed in column 0
+
+            result = []
+            for r in range(row_lo, row_hi + 1):
+                for c in cols:
+                    for key in self._cells.get((r, c), ()):
+                        st = self._stations[key]
+                        if not (south <= st['lat'] <= north):
+                            continue
+                        lon = st['lon']
+                        if whole_world:
+                            in_lon = True
+                        elif crosses:
+                            in_lon = lon >= west or lon <= east
+                        else:
+                            in_lon = west <= lon <= east
+                        if in_lon:
+                            result.append(dict(st))
+        return result
+
+    def tiles(self, south, west, north, east, zoom):
+        """Return precomputed AQI aggregates for tiles covering the viewport"""
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        west, east, whole_world = viewport_lons(west, east)
+        x_min, y_min = lat_lon_to_tile(north, west, zoom)
+        x_max, y_max = lat_lon_to_tile(south, east, zoom)
+        crosses = west > east
+
+        def in_view(x, y):
+            if not (y_min <= y <= y_max):
+                return False
+            if whole_world:
+                return True
+            return (x >= x_min or x <= x_max) if crosses else (x_min <= x <= x_max)
+
+        with self._lock:
+            self._expire(time.time())
+            result = []
+            for (x, y), agg in self._tiles[zoom].items():
+                if in_view(x, y):
+                    result.append(dict(agg.summary(), z=zoom, x=x, y=y, bounds=tile_bounds(x, y, zoom)))
+        result.sort(key=lambda t: (t['y'], t['x']))
+        return result
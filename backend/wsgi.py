@@ -0,0 +1,31 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+With preload_app enabled, gunicorn imports this module once in the master
+process. The model is loaded here, before any worker is forked, so its
+tree arrays live in pages that workers share copy-on-write.
+"""
+import gc
+import os
+
+# Load the model in the master; a background thread would not survive fork()
+os.environ.setdefault('MODEL_LOADING', 'eager')
+# Share realtime results (and, through them, provider budgets) between
+# workers instead of keeping them per process
+os.environ.setdefault('REALTIME_CACHE_BACKEND', 'sqlite')
+
+from app import app, model_handle  # noqa: E402
+
+# A forest fitted with n_jobs=-1 would fan every single-row predict out
+# over all cores in every worker; one process per core is already the parallelism.
+if model_handle.model is not None and hasattr(model_handle.model, 'n_jobs'):
+    model_handle.model.n_jobs = 1
+
+# Move everything allocated so far into the permanent GC generation so the
+# collector in each worker never writes to (and un-shares) those pages.
+gc.collect()
+gc.freeze()
+
+application = app
@@ -61,6 +61,30 @@ export const apiService = {
   const response = await api.get('/search_city', { params: { city } });
   return response.data;
   },
+
+  // Get aggregated AQI tiles for a map viewport
+  getMapTiles: async ({ south, west, north, east }, zoom = 3) => {
+    const response = await api.get('/map/tiles', {
+      params: { south, west, north, east, zoom },
+    });
+    return response.data;
+  },
+
+  // Get interpolated AQI heat-map grid for a map viewport
+  getHeatmap: async ({ south, west, north, east }, rows = 50, cols = 50) => {
+    const response = await api.get('/map/heatmap', {
+      params: { south, west, north, east, rows, cols },
+    });
+    return response.data;
+  },
+
+  // Get nearest stored stations to a point
+  getNearestStations: async (lat, lon, k = 5) => {
+    const response = await api.get('/map/nearest', {
+      params: { lat, lon, k },
+    });
+    return response.data;
+  },
 };
 
 export default api;
\ No newline at end of file
@@ -0,0 +1,325 @@
+"""
+Incremental retraining job fed by realtime readings stored by the backend.
+
+Each run pulls only the readings added since the previous run (tracked by
+reading id in models/registry.json), updates the current model with them,
+validates the candidate on held-out realtime readings and on the base
+dataset split, measures its inference latency, and publishes a new
+versioned artifact only if every budget passes. Training rows of a
+rejected candidate are kept in models/pending_train.csv and used again
+by the next run, so real readings build up until they can move the model.
+
+    python retrain_online.py                 # single run (e.g. from cron)
+    python retrain_online.py --every 60      # run every 60 minutes
+
+Tree ensembles are updated in place of a full refit: Random Forest grows a
+few new trees on the new rows (dropping the oldest beyond --max-trees),
+Gradient Boosting adds boosting stages fitted on the new rows. Other
+models are refit on the new rows plus a bounded sample of the base
+dataset. Either way, run time scales with the new data, not total history.
+"""
+import argparse
+import copy
+import functools
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import train_test_split
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ML_DIR, '..', 'backend'))
+
+from history import ReadingHistory  # noqa: E402
+
+MODELS_DIR = os.path.join(ML_DIR, 'models')
+REGISTRY_PATH = os.path.join(MODELS_DIR, 'registry.json')
+RECENT_HOLDOUT_PATH = os.path.join(MODELS_DIR, 'holdout_recent.csv')
+PENDING_TRAIN_PATH = os.path.join(MODELS_DIR, 'pending_train.csv')
+TARGET = 'AQI'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Incremental AQI model retraining')
+    parser.add_argument('--history', default=os.path.join(ML_DIR, '..', 'backend', 'data', 'readings.sqlite3'),
+                        help='Readings database written by the backend')
+    parser.add_argument('--min-new', type=int, default=50, help='Minimum new readings before retraining')
+    parser.add_argument('--max-new', type=int, default=50000, help='Cap on readings consumed per run')
+    parser.add_argument('--new-trees', type=int, default=10, help='Trees / boosting stages added per run')
+    parser.add_argument('--max-trees', type=int, default=200, help='Random Forest size cap (oldest trees dropped)')
+    parser.add_argument('--holdout-fraction', type=float, default=0.2,
+                        help='Share of new readings (the newest) kept back for validation')
+    parser.add_argument('--recent-holdout-size', type=int, default=5000,
+                        help='Most recent held-out readings kept for validation')
+    parser.add_argument('--pending-size', type=int, default=20000,
+                        help='Training rows kept from rejected runs for the next run')
+    parser.add_argument('--mae-tolerance', type=float, default=0.02,
+                        help='Allowed relative MAE regression on recent realtime readings')
+    parser.add_argument('--base-mae-tolerance', type=float, default=0.10,
+                        help='Allowed relative MAE regression on the base dataset split')
+    parser.add_argument('--max-mae', type=float, default=None, help='Absolute recent-readings MAE budget')
+    parser.add_argument('--latency-budget-ms', type=float, default=50.0,
+                        help='p95 single-row predict latency budget')
+    parser.add_argument('--every', type=float, default=None, help='Repeat every N minutes')
+    return parser.parse_args()
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+def load_registry():
+    if os.path.exists(REGISTRY_PATH):
+        with open(REGISTRY_PATH) as fh:
+            return json.load(fh)
+    return {'current_version': 0, 'last_reading_id': 0, 'versions': [], 'runs': []}
+
+
+def save_registry(registry):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    tmp = REGISTRY_PATH + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(registry, fh, indent=2)
+    os.replace(tmp, REGISTRY_PATH)
+
+
+def current_model_path(registry):
+    for version in registry['versions']:
+        if version['version'] == registry['current_version']:
+            return os.path.join(ML_DIR, version['path'])
+    return os.path.join(ML_DIR, 'aqi_model.pkl')
+
+
+# ============================================
+# DATA
+# ============================================
+
+def base_holdout(feature_names):
+    """The same test split train_model.py evaluates on, including its 99th-percentile clip"""
+    df = pd.read_csv(os.path.join(ML_DIR, 'aqi_dataset.csv'))
+    X = df[feature_names].copy()
+    for col in feature_names:
+        X[col] = X[col].clip(upper=X[col].quantile(0.99))
+    _, X_test, _, y_test = train_test_split(X, df[TARGET], test_size=0.2, random_state=42)
+    return X_test, y_test
+
+
+def update_recent_holdout(new_holdout, limit):
+    """Append newly held-out readings and keep only the most recent `limit` rows"""
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    if os.path.exists(RECENT_HOLDOUT_PATH):
+        recent = pd.concat([pd.read_csv(RECENT_HOLDOUT_PATH), new_holdout], ignore_index=True)
+    else:
+        recent = new_holdout
+    recent = recent.tail(limit)
+    recent.to_csv(RECENT_HOLDOUT_PATH, index=False)
+    return recent
+
+
+def load_pending():
+    """Training rows left over from rejected runs"""
+    if os.path.exists(PENDING_TRAIN_PATH):
+        return pd.read_csv(PENDING_TRAIN_PATH)
+    return None
+
+
+def save_pending(rows, limit):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    rows.tail(limit).to_csv(PENDING_TRAIN_PATH, index=False)
+
+
+def clear_pending():
+    if os.path.exists(PENDING_TRAIN_PATH):
+        os.remove(PENDING_TRAIN_PATH)
+
+
+# ============================================
+# MODEL UPDATE AND VALIDATION
+# ============================================
+
+def update_model(model, X_new, y_new, feature_names, args):
+    """Return an updated copy of `model` trained on the new rows"""
+    candidate = copy.deepcopy(model)
+    name = type(candidate).__name__
+
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        candidate.set_params(warm_start=True, n_estimators=len(candidate.estimators_) + args.new_trees)
+        candidate.fit(X_new, y_new)
+        if len(candidate.estimators_) > args.max_trees:
+            candidate.estimators_ = candidate.estimators_[-args.max_trees:]
+            candidate.n_estimators = args.max_trees
+        return candidate, f'+{args.new_trees} trees ({len(candidate.estimators_)} total)'
+
+    if name == 'GradientBoostingRegressor':
+        candidate.set_params(warm_start=True, n_estimators=candidate.n_estimators_ + args.new_trees)
+        candidate.fit(X_new, y_new)
+        return candidate, f'+{args.new_trees} stages ({candidate.n_estimators_} total)'
+
+    # No warm start: refit on the new rows plus a bounded sample of the base data
+    df = pd.read_csv(os.path.join(ML_DIR, 'aqi_dataset.csv'))
+    sample = df.sample(n=min(len(df), max(len(X_new) * 4, 1000)), random_state=42)
+    X = pd.concat([sample[feature_names], X_new], ignore_index=True)
+    y = pd.concat([sample[TARGET], y_new], ignore_index=True)
+    if 'Linear' in name:
+        candidate.fit(load_scaler().transform(X), y)
+    else:
+        candidate.fit(X, y)
+    return candidate, f'refit on {len(X)} rows'
+
+
+@functools.lru_cache(maxsize=1)
+def load_scaler():
+    return joblib.load(os.path.join(ML_DIR, 'scaler.pkl'))
+
+
+def predict(model, X):
+    if 'Linear' in type(model).__name__:
+        return model.predict(load_scaler().transform(X))
+    return model.predict(X)
+
+
+def p95_latency_ms(model, X, runs=200):
+    """p95 latency of single-row predicts, as served by /api/predict"""
+    rows = [X.iloc[[i % len(X)]] for i in range(runs)]
+    predict(model, rows[0])  # warm-up
+    timings = []
+    for row in rows:
+        started = time.perf_counter()
+        predict(model, row)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.percentile(timings, 95))
+
+
+def publish(model, registry, stats):
+    """Write a versioned artifact, then atomically swap it in as aqi_model.pkl"""
+    version = max([v['version'] for v in registry['versions']] + [0]) + 1
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    relative = os.path.join('models', f'aqi_model_v{version}.pkl')
+    joblib.dump(model, os.path.join(ML_DIR, relative))
+
+    live_path = os.path.join(ML_DIR, 'aqi_model.pkl')
+    tmp = live_path + '.tmp'
+    joblib.dump(model, tmp)
+    os.replace(tmp, live_path)
+
+    registry['versions'].append(dict(stats, version=version, path=relative,
+                                     created_at=datetime.now().isoformat()))
+    registry['current_version'] = version
+    return version
+
+
+# ============================================
+# JOB
+# ============================================
+
+def run_once(args):
+    started = time.perf_counter()
+    registry = load_registry()
+    feature_names = joblib.load(os.path.join(ML_DIR, 'feature_names.pkl'))
+
+    print(f"📂 Pulling readings after id {registry['last_reading_id']}...")
+    history = ReadingHistory(args.history)
+    rows = history.since(registry['last_reading_id'], limit=args.max_new)
+    if len(rows) < args.min_new:
+        print(f"⏭️ Only {len(rows)} new readings (need {args.min_new}); nothing to do.")
+        return None
+
+    new = pd.DataFrame(rows).sort_values('id')
+    last_id = int(new['id'].max())
+    # The backend stores each IQAir measurement once; this also drops repeats
+    # stored before it did
+    new = new.drop_duplicates(subset=['location'] + feature_names + [TARGET])
+    new = new[feature_names + [TARGET]].dropna()
+    # Hold out the newest readings rather than a random sample, so validation
+    # rows come after, and never alongside, the rows the candidate trains on
+    n_holdout = int(round(len(new) * args.holdout_fraction))
+    train_new, holdout_new = new.iloc[:len(new) - n_holdout], new.iloc[len(new) - n_holdout:]
+    print(f"✅ {len(new)} new readings: {len(train_new)} for training, {len(holdout_new)} held out")
+
+    pending = load_pending()
+    train = train_new if pending is None else pd.concat([pending, train_new], ignore_index=True)
+    if pending is not None:
+        print(f"  ✓ {len(pending)} training rows carried over from rejected runs")
+
+    X_base, y_base = base_holdout(feature_names)
+    recent = update_recent_holdout(holdout_new, args.recent_holdout_size)
+    X_recent, y_recent = recent[feature_names], recent[TARGET]
+
+    print("🤖 Updating model...")
+    current = joblib.load(current_model_path(registry))
+    fit_started = time.perf_counter()
+    candidate, change = update_model(current, train[feature_names], train[TARGET], feature_names, args)
+    fit_seconds = time.perf_counter() - fit_started
+    print(f"  ✓ {type(candidate).__name__}: {change} in {fit_seconds:.2f}s")
+
+    # Recent realtime readings decide whether the model improved; the base
+    # split only guards against forgetting what the model already knew.
+    recent_current = mean_absolute_error(y_recent, predict(current, X_recent))
+    recent_candidate = mean_absolute_error(y_recent, predict(candidate, X_recent))
+    base_current = mean_absolute_error(y_base, predict(current, X_base))
+    base_candidate = mean_absolute_error(y_base, predict(candidate, X_base))
+    latency = p95_latency_ms(candidate, X_base)
+
+    recent_ok = recent_candidate <= recent_current * (1 + args.mae_tolerance)
+    if args.max_mae is not None:
+        recent_ok = recent_ok and recent_candidate <= args.max_mae
+    base_ok = base_candidate <= base_current * (1 + args.base_mae_tolerance)
+    latency_ok = latency <= args.latency_budget_ms
+
+    print(f"  ✓ Recent-readings MAE: {recent_current:.2f} (current) -> {recent_candidate:.2f} (candidate) "
+          f"{'✅' if recent_ok else '❌'}")
+    print(f"  ✓ Base holdout MAE: {base_current:.2f} (current) -> {base_candidate:.2f} (candidate) "
+          f"{'✅' if base_ok else '❌'}")
+    print(f"  ✓ p95 predict latency: {latency:.2f} ms (budget {args.latency_budget_ms} ms) "
+          f"{'✅' if latency_ok else '❌'}")
+
+    stats = {
+        'new_readings': len(new),
+        'training_rows': len(train),
+        'recent_mae': round(recent_candidate, 3),
+        'previous_recent_mae': round(recent_current, 3),
+        'holdout_mae': round(base_candidate, 3),
+        'previous_mae': round(base_current, 3),
+        'p95_latency_ms': round(latency, 3),
+        'change': change,
+    }
+    version = None
+    if recent_ok and base_ok and latency_ok:
+        version = publish(candidate, registry, stats)
+        clear_pending()
+        print(f"💾 Published model v{version} (restart the backend workers to pick it up)")
+    else:
+        save_pending(train, args.pending_size)
+        print(f"🚫 Candidate rejected; current model kept, {min(len(train), args.pending_size)} "
+              "training rows kept for the next run")
+
+    # Readings are consumed either way: training rows of a rejected run live
+    # on in the pending buffer, held-out rows in the recent holdout.
+    registry['last_reading_id'] = last_id
+    registry['runs'].append(dict(stats, at=datetime.now().isoformat(), published_version=version,
+                                 seconds=round(time.perf_counter() - started, 2)))
+    registry['runs'] = registry['runs'][-100:]
+    save_registry(registry)
+    print(f"⏱️ Run finished in {time.perf_counter() - started:.2f}s")
+    return version
+
+
+def main():
+    args = parse_args()
+    print("🚀 Starting incremental AQI retraining...\n")
+    while True:
+        run_once(args)
+        if args.every is None:
+            break
+        print(f"\n😴 Next run in {args.every:g} minutes\n")
+        time.sleep(args.every * 60)
+
+
+if __name__ == '__main__':
+    main()